@@ -0,0 +1,322 @@
+"""A read-only HTTP API for the forecasts, to run next to the app.
+
+It serves the latest forecast snapshot, the same one the pages show:
+    GET /api/v1/global                  the global total forecast
+    GET /api/v1/regions                 the forecast of every continent and group of countries
+    GET /api/v1/countries               the forecast of every country
+    GET /api/v1/countries/<code>        the forecast of one country, by ISO alpha-3 code
+    GET /api/v1/capacities              the solar capacity of each country
+    GET /metrics                        the server's metrics, see `metrics.py`
+
+Responses are JSON, or add `?format=parquet` or `?format=arrow` (an Arrow IPC stream) for bulk
+use. Every response has a strong ETag, so clients can revalidate with `If-None-Match`, and is
+compressed with gzip, or brotli if the `brotli` extra is installed.
+
+Run from the repo root:
+    python src/v1/api.py --port 8000
+"""
+
+import argparse
+import functools
+import gzip
+import hashlib
+import io
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+from capacities import load_capacity_table
+from loguru import logger
+from metrics import configure_logging
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from snapshot import latest_snapshot_version, load_snapshot
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+api_prefix = "/api/v1/"
+
+content_types = {
+    "json": "application/json",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# how long clients may use a response without revalidating it
+max_age_seconds = 60
+
+
+class NotFoundError(Exception):
+    """The requested resource does not exist."""
+
+
+@dataclass(frozen=True)
+class Representation:
+    """A response body, ready to send."""
+
+    body: bytes
+    content_type: str
+    etag: str
+
+
+def get_table(version: str, resource: str) -> pd.DataFrame:
+    """Get the table for an API resource, from a snapshot.
+
+    Raises:
+        NotFoundError: If there is no such resource
+    """
+    snapshot = load_snapshot(version)
+    capacities = load_capacity_table()
+
+    if resource == "capacities":
+        return capacities.table.reset_index()
+
+    if resource == "global":
+        # the same percentage as the command line, of the capacity of the countries forecast
+        cube = snapshot.cube
+        return pd.DataFrame(
+            {
+                "timestamp": cube.timestamps,
+                "power_gw": cube.total_gw,
+                "power_percentage": cube.total_percentage(capacities.capacity_per_country),
+            },
+        )
+
+    if resource == "regions":
+        regions = snapshot.aggregates.regions
+        return (
+            regions.rename_axis(index="timestamp", columns="region")
+            .melt(value_name="power_gw", ignore_index=False)
+            .reset_index()
+        )
+
+    forecasts = snapshot.forecasts[["timestamp", "country_code", "power_gw", "power_percentage"]]
+    if resource == "countries":
+        return forecasts
+
+    if resource.startswith("countries/"):
+        country_code = resource.removeprefix("countries/").upper()
+        forecast = forecasts[forecasts["country_code"] == country_code]
+        if len(forecast) == 0:
+            raise NotFoundError(f"No forecast for {country_code}")
+        return forecast.reset_index(drop=True)
+
+    raise NotFoundError(f"No resource {resource}")
+
+
+def encode_table(df: pd.DataFrame, output_format: str, meta: dict[str, Any]) -> bytes:
+    """Encode a table as JSON records with some metadata, parquet or an Arrow IPC stream."""
+    if output_format == "json":
+        df = df.copy()
+        for column in df.select_dtypes("datetime").columns:
+            df[column] = df[column].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+        return orjson.dumps({**meta, "data": df.to_dict(orient="records")})
+
+    if output_format == "parquet":
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return bytes(sink.getvalue())
+
+
+@functools.lru_cache(maxsize=256)
+def render(version: str, resource: str, output_format: str) -> Representation:
+    """Render an API resource from a snapshot. Snapshots never change, so they are cached.
+
+    Raises:
+        NotFoundError: If there is no such resource
+    """
+    snapshot = load_snapshot(version)
+    meta = {"version": snapshot.version, "forecast_hour": snapshot.forecast_hour}
+    body = encode_table(get_table(version, resource), output_format, meta)
+    return Representation(
+        body=body,
+        content_type=content_types[output_format],
+        etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def render_encoded(
+    version: str,
+    resource: str,
+    output_format: str,
+    encoding: str,
+) -> Representation:
+    """Render an API resource compressed with a content encoding, `identity` for none.
+
+    Each encoding is a different representation, so it has its own ETag.
+    """
+    representation = render(version, resource, output_format)
+    if encoding == "identity":
+        return representation
+
+    if encoding == "br":
+        body = brotli.compress(representation.body)
+    else:
+        body = gzip.compress(representation.body, compresslevel=6, mtime=0)
+    return Representation(
+        body=body,
+        content_type=representation.content_type,
+        etag=f'{representation.etag[:-1]}-{encoding}"',
+    )
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Choose the best content encoding the client accepts."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag, using the weak comparison."""
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves the API's resources."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        """Serve a resource."""
+        self.respond(send_body=True)
+
+    def do_HEAD(self) -> None:
+        """Serve a resource's headers."""
+        self.respond(send_body=False)
+
+    def respond(self, send_body: bool) -> None:
+        """Serve a resource, with or without its body."""
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            self.send_metrics(send_body)
+            return
+        if not url.path.startswith(api_prefix):
+            self.send_error_json(404, "Not found", send_body)
+            return
+        resource = url.path.removeprefix(api_prefix).strip("/")
+        output_format = parse_qs(url.query).get("format", ["json"])[0]
+        if output_format not in content_types:
+            self.send_error_json(400, f"Unknown format {output_format}", send_body)
+            return
+
+        version = latest_snapshot_version()
+        if version is None:
+            self.send_error_json(503, "No forecasts yet", send_body, retry_after=60)
+            return
+
+        encoding = choose_encoding(self.headers.get("Accept-Encoding", ""))
+        try:
+            representation = render_encoded(version, resource, output_format, encoding)
+        except NotFoundError as e:
+            self.send_error_json(404, str(e), send_body)
+            return
+
+        if etag_matches(self.headers.get("If-None-Match", ""), representation.etag):
+            self.send_response(304)
+            self.send_common_headers(representation.etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_common_headers(representation.etag)
+        self.send_header("Content-Type", representation.content_type)
+        self.send_header("Content-Length", str(len(representation.body)))
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(representation.body)
+
+    def send_metrics(self, send_body: bool) -> None:
+        """Send the metrics, in the Prometheus text format."""
+        body = generate_latest()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def send_common_headers(self, etag: str) -> None:
+        """Send the caching headers shared by full and not modified responses."""
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"public, max-age={max_age_seconds}")
+        self.send_header("Vary", "Accept-Encoding")
+
+    def send_error_json(
+        self,
+        status: int,
+        message: str,
+        send_body: bool,
+        retry_after: int | None = None,
+    ) -> None:
+        """Send an error as JSON, or only its headers."""
+        body = orjson.dumps({"error": message})
+        self.send_response(status)
+        self.send_header("Content-Type", content_types["json"])
+        self.send_header("Content-Length", str(len(body)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        """Log requests with loguru."""
+        logger.debug(format % args)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+    """Make the API server, on a port (0 for any free one)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Serve the forecasts over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    configure_logging()
+    server = make_server(args.host, args.port)
+    logger.info(f"Serving the forecast API at http://{args.host}:{server.server_port}{api_prefix}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
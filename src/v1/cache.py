@@ -0,0 +1,115 @@
+"""Persistent cache of forecast results, so restarts do not start from cold.
+
+Forecasts are stored in a SQLite database keyed by the site parameters and the forecast hour.
+Only the latest hour is kept for each site, so a stale result is available to serve while a
+fresh one is fetched, unless it is more than `max_stale_hours` old. They are stored as the API
+returned them, before smoothing.
+"""
+
+import functools
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+data_dir = "src/v1/data"
+
+cache_path = os.getenv("FORECAST_CACHE_PATH", f"{data_dir}/cache/forecasts.sqlite")
+
+# cached forecasts older than this many forecast hours are fetched again rather than served
+max_stale_hours = int(os.getenv("FORECAST_MAX_STALE_HOURS", "3"))
+
+
+def site_key(capacity: float, lat: float, lon: float) -> str:
+    """Make a cache key from the site parameters."""
+    return f"{lat:.6f}|{lon:.6f}|{capacity:.6f}"
+
+
+def current_forecast_hour() -> str:
+    """The forecast hour we currently ask the API for, in ISO format (UTC, naive)."""
+    return pd.Timestamp.now(tz="UTC").floor("h").replace(tzinfo=None).isoformat()
+
+
+def forecast_hour_age(forecast_hour: str) -> int:
+    """How many hours older a forecast hour is than the current one."""
+    age = pd.Timestamp(current_forecast_hour()) - pd.Timestamp(forecast_hour)
+    return int(age / pd.Timedelta(hours=1))
+
+
+class ForecastCache:
+    """Forecast results kept in memory and persisted to SQLite."""
+
+    def __init__(self, path: str) -> None:
+        """Open (or create) the cache at the given path."""
+        self.path = path
+        self._memory: dict[str, tuple[str, pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "site_key TEXT NOT NULL, "
+                "forecast_hour TEXT NOT NULL, "
+                "data TEXT NOT NULL, "
+                "PRIMARY KEY (site_key, forecast_hour))",
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> tuple[str, pd.DataFrame] | None:
+        """Get the latest forecast hour and forecast for a site, or None if never cached."""
+        with self._lock:
+            cached = self._memory.get(key)
+        if cached is None:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT forecast_hour, data FROM predictions WHERE site_key = ? "
+                    "ORDER BY forecast_hour DESC LIMIT 1",
+                    (key,),
+                ).fetchone()
+            if row is None:
+                return None
+            split = json.loads(row[1])
+            forecast = pd.DataFrame(split["data"], index=split["index"], columns=split["columns"])
+            cached = (row[0], forecast)
+            with self._lock:
+                self._memory[key] = cached
+
+        forecast_hour, forecast = cached
+        return forecast_hour, forecast.copy()
+
+    def put(self, key: str, forecast_hour: str, forecast: pd.DataFrame) -> None:
+        """Store the forecast for a site, replacing any older forecast hours."""
+        split = {
+            "index": [str(i) for i in forecast.index],
+            "columns": list(forecast.columns),
+            "data": forecast.to_numpy().tolist(),
+        }
+        with self._connect() as conn:
+            conn.execute("DELETE FROM predictions WHERE site_key = ?", (key,))
+            conn.execute(
+                "INSERT INTO predictions (site_key, forecast_hour, data) VALUES (?, ?, ?)",
+                (key, forecast_hour, json.dumps(split)),
+            )
+        with self._lock:
+            self._memory[key] = (forecast_hour, forecast.copy())
+
+
+@functools.cache
+def get_forecast_cache() -> ForecastCache:
+    """Get the forecast cache shared by this process."""
+    return ForecastCache(cache_path)
@@ -0,0 +1,85 @@
+"""The solar capacity of each country, loaded once per process.
+
+The table is read from `solar_capacities.csv`, which `data/get_solar_capacities.py` writes,
+into Arrow backed columns. The lookups the pages need are built from it once, rather than on
+every rerun.
+"""
+
+import functools
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+import pandas as pd
+from metrics import timed
+
+data_dir = "src/v1/data"
+
+capacities_path = f"{data_dir}/solar_capacities.csv"
+
+capacity_columns = ["country_code", "capacity_gw", "country_name", "source"]
+
+
+@dataclass(frozen=True)
+class CapacityTable:
+    """The solar capacities table, with ready made lookups.
+
+    Attributes:
+        table: The capacities, indexed by country code
+        capacity_per_country: Country code to capacity in GW
+        labels: `"<country code> - <country name>"` for each country, for selectors
+        global_capacity_gw: Total capacity of all countries in GW
+    """
+
+    table: pd.DataFrame
+    capacity_per_country: Mapping[str, float]
+    labels: list[str]
+    global_capacity_gw: float
+
+
+def validate_capacities(df: pd.DataFrame) -> pd.DataFrame:
+    """Check the capacities table, dropping rows without a country code.
+
+    Raises:
+        ValueError: If columns are missing, country codes are repeated, or capacities are
+            missing or negative
+    """
+    missing_columns = set(capacity_columns) - set(df.columns)
+    if missing_columns:
+        raise ValueError(f"Capacities are missing columns {sorted(missing_columns)}")
+
+    df = df.dropna(subset=["country_code"])
+
+    repeated = df["country_code"][df["country_code"].duplicated()]
+    if len(repeated) > 0:
+        raise ValueError(f"Capacities are repeated for {', '.join(repeated)}")
+
+    invalid = df["country_code"][~(df["capacity_gw"] >= 0)]
+    if len(invalid) > 0:
+        raise ValueError(f"Capacities are missing or negative for {', '.join(invalid)}")
+
+    return df
+
+
+@functools.cache
+def load_capacity_table() -> CapacityTable:
+    """Load and check the capacities table, once per process."""
+    with timed("capacity_load"):
+        df = pd.read_csv(capacities_path, engine="pyarrow", dtype_backend="pyarrow")
+        table = validate_capacities(df)[capacity_columns].set_index("country_code")
+
+        return CapacityTable(
+            table=table,
+            capacity_per_country={
+                str(country_code): float(capacity_gw)
+                for country_code, capacity_gw in table["capacity_gw"].items()
+            },
+            labels=[
+                f"{country_code} - {country_name}"
+                for country_code, country_name in zip(
+                    table.index,
+                    table["country_name"],
+                    strict=True,
+                )
+            ],
+            global_capacity_gw=float(table["capacity_gw"].sum()),
+        )
@@ -0,0 +1,186 @@
+"""Forecast sites spread over the large countries, rather than one site at the centroid.
+
+A large country's weather varies too much for its centroid to stand for all of it. Each large
+country is split into a grid of cells, and each cell gets a forecast site inside it, weighted
+by the share of the country's land area in the cell. A country's forecast is then the
+weighted sum of the forecasts of its cells.
+
+The cells are built once from `countries.geojson` and saved as a small csv, so the pages and
+the snapshot worker don't do any geometry work. Rebuild it after changing the geometries or
+capacities, by running from the repo root:
+    python src/v1/cells.py
+
+Multi-point forecasts are used when FORECAST_MULTI_POINT=1. Each cell is one more request to
+the API, up to `max_cells` per country, but cells sharing a weather grid point are fetched
+once in normalised mode, see `forecast.normalise_site`.
+"""
+
+import functools
+import os
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from capacities import load_capacity_table
+from registry import load_world
+
+data_dir = "src/v1/data"
+
+cells_path = f"{data_dir}/country_cells.csv"
+
+multi_point_forecasts = os.getenv("FORECAST_MULTI_POINT", "0") == "1"
+
+# countries at least this large, with at least this much capacity, are split into cells
+min_area_km2 = 1_000_000
+min_capacity_gw = 1.0
+
+# the most cells for one country, and the smallest share of its area worth a cell
+max_cells = 16
+min_weight = 0.01
+
+# cell sizes are a multiple of the weather model's grid
+cell_step_degrees = 0.25
+
+# separates the country code and the cell number, in the keys of cell sites
+cell_separator = ":"
+
+
+@dataclass(frozen=True)
+class CountryCells:
+    """The forecast sites of a country's cells, with the weight of each."""
+
+    lats: np.ndarray
+    lons: np.ndarray
+    weights: np.ndarray
+
+
+def build_country_cells() -> pd.DataFrame:
+    """Split the large countries into cells, and save them to `cells_path`."""
+    import geopandas as gpd
+    from shapely import box
+
+    world = load_world().drop_duplicates("adm0_a3")
+    areas_km2 = world.to_crs("EPSG:6933").geometry.area / 1e6
+    capacity_per_country = load_capacity_table().capacity_per_country
+
+    rows = []
+    for i in world.index[areas_km2 >= min_area_km2]:
+        country_code = world.loc[i, "adm0_a3"]
+        if capacity_per_country.get(country_code, 0) < min_capacity_gw:
+            continue
+
+        geometry = world.loc[i, "geometry"]
+        min_lon, min_lat, max_lon, max_lat = geometry.bounds
+        # cells about the size to cover the bounding box with `max_cells` of them
+        size = np.sqrt((max_lon - min_lon) * (max_lat - min_lat) / max_cells)
+        size = max(cell_step_degrees, round(size / cell_step_degrees) * cell_step_degrees)
+
+        grid = gpd.GeoSeries(
+            [
+                box(lon, lat, lon + size, lat + size)
+                for lon in np.arange(min_lon, max_lon, size)
+                for lat in np.arange(min_lat, max_lat, size)
+            ],
+            crs=world.crs,
+        )
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore")
+            land = grid.intersection(geometry)
+            land = land[~land.is_empty]
+            weights = land.to_crs("EPSG:6933").area.to_numpy()
+            points = land.representative_point()
+
+        weights = weights / weights.sum()
+        keep = np.argsort(-weights, kind="stable")[:max_cells]
+        keep = keep[weights[keep] >= min_weight]
+        weights = weights[keep] / weights[keep].sum()
+
+        for cell, (point, weight) in enumerate(zip(points.iloc[keep], weights, strict=True)):
+            rows.append(
+                {
+                    "country_code": country_code,
+                    "cell": cell,
+                    "lat": round(point.y, 4),
+                    "lon": round(point.x, 4),
+                    "weight": round(weight, 6),
+                },
+            )
+
+    cells = pd.DataFrame(rows).sort_values(["country_code", "cell"])
+    cells.to_csv(cells_path, index=False)
+
+    return cells
+
+
+@functools.cache
+def load_country_cells() -> dict[str, CountryCells]:
+    """Load the cells of each large country, by country code. It is only read once per process."""
+    cells = pd.read_csv(cells_path)
+    return {
+        str(country_code): CountryCells(
+            lats=group["lat"].to_numpy(),
+            lons=group["lon"].to_numpy(),
+            weights=group["weight"].to_numpy(),
+        )
+        for country_code, group in cells.groupby("country_code", sort=True)
+    }
+
+
+def expand_sites(
+    sites: dict[str, tuple[str, float, float, float]],
+) -> tuple[dict[str, tuple[str, float, float, float]], dict[str, float]]:
+    """Replace the site of each large country with the sites of its cells.
+
+    Each cell site has the country's capacity, its forecast is weighted when the cells are
+    combined, see `combine_cells`.
+
+    Args:
+        sites: Mapping of country code to `(name, capacity, lat, lon)`, see `registry.get_sites`
+
+    Returns:
+        The sites, keyed by `<country code>:<cell>` for cells and by country code otherwise,
+        and the weight of each site
+    """
+    country_cells = load_country_cells()
+
+    expanded: dict[str, tuple[str, float, float, float]] = {}
+    weights: dict[str, float] = {}
+    for country_code, (name, capacity, lat, lon) in sites.items():
+        cells = country_cells.get(country_code)
+        if cells is None:
+            expanded[country_code] = (name, capacity, lat, lon)
+            weights[country_code] = 1.0
+            continue
+        for i, (cell_lat, cell_lon, weight) in enumerate(
+            zip(cells.lats, cells.lons, cells.weights, strict=True),
+        ):
+            key = f"{country_code}{cell_separator}{i}"
+            expanded[key] = (f"{name} (cell {i})", capacity, float(cell_lat), float(cell_lon))
+            weights[key] = float(weight)
+
+    return expanded, weights
+
+
+def site_country(key: str) -> str:
+    """The country code of a site's key, see `expand_sites`."""
+    return key.partition(cell_separator)[0]
+
+
+def combine_cells(forecasts: list[pd.DataFrame], weights: list[float]) -> pd.DataFrame:
+    """Combine the forecasts of a country's cells into the country's forecast.
+
+    The forecast is the weighted sum of the cells' forecasts, at the timestamps they all have.
+    The weights are rescaled to sum to one, so that cells without a forecast are left out.
+    """
+    if len(forecasts) == 1:
+        return forecasts[0]
+
+    power_kw = pd.concat([forecast["power_kw"] for forecast in forecasts], axis=1, join="inner")
+    cell_weights = np.asarray(weights, dtype=float)
+    cell_weights /= cell_weights.sum()
+    return pd.DataFrame({"power_kw": power_kw.to_numpy() @ cell_weights}, index=power_kw.index)
+
+
+if __name__ == "__main__":
+    build_country_cells()
@@ -0,0 +1,116 @@
+"""Compute the global solar forecast from the command line, without running the app.
+
+This runs the same steps as the app: the capacities and locations from the country registry,
+the forecasts from the API, then smoothing and the global total. It writes the forecast of
+each country and the global total to an output directory.
+
+Run from the repo root, for example:
+    python src/v1/cli.py --output forecasts --format csv --countries GBR FRA DEU
+"""
+
+import argparse
+import sys
+from collections.abc import Mapping
+from pathlib import Path
+
+import pandas as pd
+from cube import build_forecast_cube
+from forecast import get_country_forecasts, max_in_flight
+from loguru import logger
+from metrics import configure_logging
+from registry import get_sites
+
+
+def global_forecast(
+    forecasts: pd.DataFrame,
+    capacity_per_country: Mapping[str, float],
+) -> pd.DataFrame:
+    """Sum the forecasts of each country into a global forecast, for each timestamp."""
+    cube = build_forecast_cube(forecasts)
+    return pd.DataFrame(
+        {
+            "timestamp": cube.timestamps,
+            "power_gw": cube.total_gw,
+            "power_percentage": cube.total_percentage(capacity_per_country),
+        },
+    )
+
+
+def write_table(df: pd.DataFrame, path: Path, output_format: str) -> Path:
+    """Write a table as parquet or csv, returning the path written to."""
+    path = path.with_suffix(f".{output_format}")
+    if output_format == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point, returning the exit code."""
+    parser = argparse.ArgumentParser(description="Compute the global solar forecast.")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("forecasts"),
+        help="Directory to write the forecasts to",
+    )
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=max_in_flight,
+        help="Maximum number of forecast requests in flight at once",
+    )
+    parser.add_argument(
+        "--countries",
+        nargs="+",
+        metavar="CODE",
+        help="Only forecast these countries, by ISO alpha-3 code",
+    )
+    parser.add_argument(
+        "--cached",
+        action="store_true",
+        help="Use cached forecasts where there are any, rather than fetching them all",
+    )
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    sites = get_sites()
+    if args.countries is not None:
+        country_codes = [code.upper() for code in args.countries]
+        unknown = sorted(set(country_codes) - set(sites))
+        if unknown:
+            parser.error(f"No capacity or location for {', '.join(unknown)}")
+        sites = {code: sites[code] for code in country_codes}
+
+    logger.info(f"Forecasting {len(sites)} countries")
+    forecasts = get_country_forecasts(
+        sites,
+        max_workers=args.max_in_flight,
+        fresh=not args.cached,
+    )
+    if forecasts is None:
+        logger.error("No forecasts could be fetched")
+        return 1
+
+    missing = sorted(set(sites) - set(forecasts["country_code"]))
+    if missing:
+        logger.warning(f"Missing forecasts for {', '.join(missing)}")
+
+    capacity_per_country = {code: capacity for code, (_, capacity, _, _) in sites.items()}
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    columns = ["timestamp", "country_code", "power_gw", "power_percentage"]
+    for name, df in [
+        ("countries", forecasts[columns]),
+        ("global", global_forecast(forecasts, capacity_per_country)),
+    ]:
+        path = write_table(df, args.output / name, args.format)
+        logger.info(f"Wrote {path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""HTTP client for the Quartz Open Solar forecast API."""
+
+import functools
+import os
+import random
+import time
+
+import numpy as np
+import orjson
+import pandas as pd
+import requests
+from loguru import logger
+from metrics import record_upstream_request
+from requests.adapters import HTTPAdapter
+
+forecast_url = os.getenv("FORECAST_API_URL", "https://open.quartz.solar/forecast/")
+
+# batch endpoint, taking `{"sites": [...], "timestamp": ...}` and returning
+# `{"predictions": [...]}` with the predictions for each site in the same order
+forecast_batch_url = os.getenv("FORECAST_BATCH_API_URL", forecast_url.rstrip("/") + "/batch/")
+
+# number of connections kept open to the API, this should be at least the number in flight
+pool_size = int(os.getenv("FORECAST_POOL_SIZE", os.getenv("FORECAST_MAX_IN_FLIGHT", "16")))
+
+# responses that are worth retrying, as the next attempt may well succeed
+retry_status_codes = {429, 500, 502, 503, 504}
+
+# responses meaning the API does not have a batch endpoint
+batch_not_supported_status_codes = {404, 405, 501}
+
+
+class BatchNotSupportedError(Exception):
+    """The forecast API does not support batch requests."""
+
+
+class ForecastClient:
+    """Client with a pooled keep-alive session, that retries transient errors."""
+
+    def __init__(
+        self,
+        url: str = forecast_url,
+        batch_url: str = forecast_batch_url,
+        pool_size: int = pool_size,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        timeout_seconds: float = 20,
+    ) -> None:
+        """Create a client for the forecast API at the given url."""
+        self.url = url
+        self.batch_url = batch_url
+        # whether the API supports batch requests, None until we have tried one
+        self.batch_supported: bool | None = None
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, url: str, payload: dict[str, object]) -> requests.Response:
+        """Post a JSON payload, retrying connection errors, timeouts and transient statuses.
+
+        Retries wait with exponential backoff and full jitter, so that many failing requests
+        do not all retry at the same time.
+        """
+        endpoint = "batch" if url == self.batch_url else "single"
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                r = self.session.post(
+                    url,
+                    data=orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY),
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout_seconds,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                record_upstream_request(endpoint, type(e).__name__, time.perf_counter() - start)
+                if attempt >= self.max_retries:
+                    raise
+                logger.debug(f"Retrying forecast request after {type(e).__name__}")
+            else:
+                record_upstream_request(endpoint, str(r.status_code), time.perf_counter() - start)
+                if r.status_code not in retry_status_codes or attempt >= self.max_retries:
+                    return r
+                logger.debug(f"Retrying forecast request after status {r.status_code}")
+
+            time.sleep(random.uniform(0, self.backoff_seconds * 2**attempt))  # noqa: S311
+            attempt += 1
+
+    def get_predictions(self, site: dict[str, float], forecast_hour: str) -> pd.DataFrame | None:
+        """Get the predictions for one site, or None if the API returns an error."""
+        r = self.post(self.url, {"site": site, "timestamp": forecast_hour})
+        if r.status_code != 200:
+            return None
+        return decode_predictions(orjson.loads(r.content)["predictions"])
+
+    def get_predictions_batch(
+        self,
+        sites: list[dict[str, float]],
+        forecast_hour: str,
+    ) -> list[pd.DataFrame | None]:
+        """Get the predictions for many sites in one request.
+
+        Returns a list with the predictions for each site, all None if the API returns an error.
+
+        Raises:
+            BatchNotSupportedError: If the API does not support batch requests
+        """
+        if self.batch_supported is False:
+            raise BatchNotSupportedError
+
+        r = self.post(self.batch_url, {"sites": sites, "timestamp": forecast_hour})
+        if r.status_code in batch_not_supported_status_codes:
+            logger.info("Forecast API does not support batches, using single site requests")
+            self.batch_supported = False
+            raise BatchNotSupportedError
+
+        self.batch_supported = True
+        if r.status_code != 200:
+            return [None] * len(sites)
+        predictions = orjson.loads(r.content)["predictions"]
+        return [decode_predictions(p) for p in predictions]
+
+
+def decode_predictions(predictions: dict[str, dict[str, float]]) -> pd.DataFrame:
+    """Decode predictions straight into columnar arrays.
+
+    The API returns the predictions as `{column: {timestamp: value}}`. The values are read
+    into numpy arrays directly, rather than having pandas align a dict per row.
+    """
+    index: pd.Index | None = None
+    columns = {}
+    for key, values in predictions.items():
+        if index is None:
+            index = pd.Index(list(values.keys()))
+        columns[key] = np.fromiter(values.values(), dtype=float, count=len(values))
+    return pd.DataFrame(columns, index=index)
+
+
+@functools.cache
+def get_client() -> ForecastClient:
+    """Get the forecast client shared by this process."""
+    return ForecastClient()
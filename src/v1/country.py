@@ -2,92 +2,61 @@
 
 from zoneinfo import ZoneInfo
 
-import geopandas as gpd
 import pandas as pd
 import plotly.graph_objects as go
-import pycountry
 import pytz
 import streamlit as st
-from forecast import get_forecast
-
-data_dir = "src/v1/data"
-
-# Pre-load world geometries once
-WORLD = gpd.read_file(f"{data_dir}/countries.geojson").to_crs(crs="EPSG:4326")
-
-# Pre-compute centroids for all countries
-WORLD_PROJECTED = WORLD.to_crs("EPSG:3857")  # or EPSG:6933 for equal-area
-CENTROIDS = (
-    WORLD_PROJECTED.set_index("adm0_a3")
-    .geometry.centroid
-    .to_crs("EPSG:4326")
-    .to_frame(name="geometry")
+from cache import forecast_hour_age
+from capacities import load_capacity_table
+from cells import load_country_cells, multi_point_forecasts
+from forecast import (
+    get_country_forecasts,
+    get_forecast,
+    served_forecast_hour,
+    smooth_predictions,
 )
-CENTROIDS["lat"] = CENTROIDS.geometry.y
-CENTROIDS["lon"] = CENTROIDS.geometry.x
-
-
-def get_country_timezone(country_name: str) -> str:
-    """Get timezone for a country based on its name using pycountry and pytz."""
-    # Handle regional/organizational groupings that aren't countries
-    non_countries = {
-        "Africa",
-        "ASEAN",
-        "Asia",
-        "EU",
-        "Europe",
-        "G20",
-        "G7",
-        "Latin America and Caribbean",
-        "Middle East",
-        "North America",
-        "Oceania",
-        "OECD",
-        "World",
-    }
-    if country_name in non_countries:
+from metrics import timed
+from profiling import profiled
+from registry import get_location, load_country_registry
+from snapshot import load_latest_snapshot
+
+# Timezones to use for countries with more than one
+preferred_timezones = {
+    "US": "America/New_York",  # Eastern Time (most populated)
+    "RU": "Europe/Moscow",  # Moscow Time
+    "AU": "Australia/Sydney",  # Eastern Australia
+    "BR": "America/Sao_Paulo",  # Brasília Time (most populated)
+    "CA": "America/Toronto",  # Eastern Canada
+    "MX": "America/Mexico_City",  # Central Mexico
+    "AR": "America/Argentina/Buenos_Aires",  # Argentina
+    "CL": "America/Santiago",  # Chile
+    "KZ": "Asia/Almaty",  # Kazakhstan
+    "MN": "Asia/Ulaanbaatar",  # Mongolia
+    "CD": "Africa/Kinshasa",  # DRC
+    "ID": "Asia/Jakarta",  # Indonesia
+}
+
+
+def get_timezone(alpha_2: str) -> str:
+    """Get the timezone for a country from its ISO alpha-2 code."""
+    country_timezones = pytz.country_timezones.get(alpha_2, [])
+    if country_timezones:
+        return preferred_timezones.get(alpha_2, country_timezones[0])
+    else:
         return "UTC"
 
-    try:
-        name_mappings = {
-            "United States of America": "United States",
-            "Russian Federation (the)": "Russian Federation",
-            "Philippines (the)": "Philippines",
-            "Dominican Republic (the)": "Dominican Republic",
-            "Iran (Islamic Republic of)": "Iran",
-            "Czechia": "Czech Republic",
-            "Bosnia Herzegovina": "Bosnia and Herzegovina",
-            "Viet Nam": "Vietnam",
-            "Dem. Rep. Congo": "Congo, The Democratic Republic of the",
-        }
-
-        lookup_name = name_mappings.get(country_name, country_name)
-        country = pycountry.countries.lookup(lookup_name)
 
-        country_timezones = pytz.country_timezones.get(country.alpha_2, [])
-
-        if country_timezones:
-            preferred_timezones = {
-                "US": "America/New_York",  # Eastern Time (most populated)
-                "RU": "Europe/Moscow",  # Moscow Time
-                "AU": "Australia/Sydney",  # Eastern Australia
-                "BR": "America/Sao_Paulo",  # Brasília Time (most populated)
-                "CA": "America/Toronto",  # Eastern Canada
-                "MX": "America/Mexico_City",  # Central Mexico
-                "AR": "America/Argentina/Buenos_Aires",  # Argentina
-                "CL": "America/Santiago",  # Chile
-                "KZ": "Asia/Almaty",  # Kazakhstan
-                "MN": "Asia/Ulaanbaatar",  # Mongolia
-                "CD": "Africa/Kinshasa",  # DRC
-                "ID": "Asia/Jakarta",  # Indonesia
-            }
-
-            return preferred_timezones.get(country.alpha_2, country_timezones[0])
-        else:
-            return "UTC"
-
-    except (LookupError, AttributeError):
-        return "UTC"
+def show_forecast_age(forecast_hour: str) -> None:
+    """Show when the forecast on the page was made, and whether a newer one is on its way."""
+    age = forecast_hour_age(forecast_hour)
+    made_at = pd.Timestamp(forecast_hour).strftime("%Y-%m-%d %H:%M")
+    if age <= 0:
+        st.caption(f"Forecast made at {made_at} UTC, the latest forecast.")
+    else:
+        st.caption(
+            f"Forecast made at {made_at} UTC, {age} hour{'s' if age > 1 else ''} ago. "
+            "A newer forecast is on its way.",
+        )
 
 
 def convert_utc_to_local_time(forecast_df: pd.DataFrame, timezone_str: str) -> pd.DataFrame:
@@ -113,99 +82,16 @@ def convert_utc_to_local_time(forecast_df: pd.DataFrame, timezone_str: str) -> p
     return forecast_df
 
 
-def get_country_coords(country_code: str) -> tuple[float, float]:
-    """Return lat, lon for a given ISO alpha-3 code."""
-    if country_code in CENTROIDS.index:
-        row = CENTROIDS.loc[country_code]
-        return float(row["lat"]), float(row["lon"])
-
-    # Fallback manual coordinates for very small states not in geojson
-    fallback_coords = {
-        "HKG": (22.3193, 114.1694),
-        "SGP": (1.3521, 103.8198),
-        "MAC": (22.1987, 113.5439),
-        "MDV": (3.2028, 73.2207),
-        "AND": (42.5462, 1.6016),
-        "LUX": (49.6117, 6.1319),
-        "MCO": (43.7384, 7.4246),
-        "SMR": (43.9336, 12.4508),
-        "VAT": (41.9029, 12.4534),
-        "NRU": (-0.5228, 166.9315),
-        "TUV": (-7.1095, 177.6493),
-        "KIR": (1.8709, 157.3630),
-        "PLW": (7.5149, 134.5825),
-        "WSM": (-13.7590, -172.1046),
-        # Newly added missing countries / territories
-        "ATG": (17.0608, -61.7964),  # Antigua and Barbuda
-        "BHS": (25.0343, -77.3963),  # Bahamas
-        "BRB": (13.1939, -59.5432),  # Barbados
-        "BLZ": (17.1899, -88.4976),  # Belize
-        "DMA": (15.4150, -61.3710),  # Dominica
-        "GRD": (12.1165, -61.6790),  # Grenada
-        "KNA": (17.3578, -62.7830),  # Saint Kitts and Nevis
-        "LCA": (13.9094, -60.9789),  # Saint Lucia
-        "VCT": (13.2528, -61.1971),  # Saint Vincent and the Grenadines
-        "SYC": (-4.6796, 55.4920),   # Seychelles
-        "COM": (-11.6455, 43.3333),  # Comoros
-        "STP": (0.1864, 6.6131),     # São Tomé and Príncipe
-        "TLS": (-8.8742, 125.7275),  # Timor-Leste
-        "FJI": (-17.7134, 178.0650), # Fiji
-        "TON": (-21.1789, -175.1982),# Tonga
-        "VUT": (-15.3767, 166.9592), # Vanuatu
-        "SLB": (-9.6457, 160.1562),  # Solomon Islands
-        "MHL": (7.1315, 171.1845),   # Marshall Islands
-        "FSM": (6.8878, 158.2150),   # Micronesia
-        "CPV": (14.9177, -23.5090),  # Cabo Verde
-        "BRN": (4.5353, 114.7277),   # Brunei
-        "BHR": (26.0667, 50.5577),   # Bahrain
-        "DJI": (11.8251, 42.5903),   # Djibouti
-        "GNB": (11.8037, -15.1804),  # Guinea-Bissau
-        "SWZ": (-26.5225, 31.4659),  # Eswatini
-        "LSO": (-29.6099, 28.2336),  # Lesotho
-        "ATA": (-82.8628, 135.0000), # Antarctica
-        "ATF": (-49.2800, 69.3500),  # French Southern and Antarctic Lands
-        "FLK": (-51.7963, -59.5236), # Falkland Islands
-        "GRL": (71.7069, -42.6043),  # Greenland
-        "NCL": (-21.5511, 165.6180), # New Caledonia
-        "COK": (-21.2367, -159.7777), # Cook Islands
-        "NIU": (-19.0544, -169.8672), # Niue
-        "PYF": (-17.6797, -149.4068), # French Polynesia
-        "ASM": (-14.2706, -170.1322), # American Samoa
-        "GUM": (13.4443, 144.7937),  # Guam
-        "TKL": (-9.2002, -171.8480), # Tokelau
-        "MLT": (35.9375, 14.3754),  # Malta
-        "ESH" : (24.2155, -12.8858),  # Western Sahara
-    }
-    return fallback_coords.get(country_code, (0, 0))
-
-
+@profiled
+@timed("country_page")
 def country_page() -> None:
     """Country page, select a country and see the forecast for that country."""
     st.header("Country Solar Forecast")
     st.write("This page shows individual country forecasts in local time")
 
-    countries = list(pycountry.countries)
-
-    # Get list of countries and their solar capcities now from the Ember API
-    solar_capacity_per_country_df = pd.read_csv(
-        f"{data_dir}/solar_capacities.csv",
-        index_col=0,
-    )
-
-    # remove nans in index
-    solar_capacity_per_country_df["temp"] = solar_capacity_per_country_df.index
-    solar_capacity_per_country_df.dropna(subset=["temp"], inplace=True)
-
-    # add column with country code and name
-    solar_capacity_per_country_df["country_code_and_name"] = (
-        solar_capacity_per_country_df.index + " - " + solar_capacity_per_country_df["country_name"]
-    )
-
-    # convert to dict
-    solar_capacity_per_country = solar_capacity_per_country_df.to_dict()["capacity_gw"]
-    country_code_and_names = list(
-        solar_capacity_per_country_df["country_code_and_name"],
-    )
+    # Get list of countries and their solar capacities, from the Ember data
+    capacities = load_capacity_table()
+    country_code_and_names = capacities.labels
 
     default_index = 0
     if "selected_country_code" in st.session_state:
@@ -224,30 +110,53 @@ def country_page() -> None:
     )
     selected_country_code = selected_country.split(" - ")[0]
 
-    country = next(c for c in countries if c.alpha_3 == selected_country_code)
-
-    # Robust coordinate lookup
-    lat, lon = get_country_coords(country.alpha_3)
-
-    # Get timezone for this country using robust country-name approach
-    timezone_str = get_country_timezone(country.name)
-    st.info(f"Displaying forecast in {country.name} local time (Timezone: {timezone_str})")
-
-    capacity = solar_capacity_per_country[country.alpha_3]
-    forecast_data = get_forecast(country.name, capacity, lat, lon)
-
-    if forecast_data is None:
-        st.error(f"Unable to get forecast for {country.name}")
+    registry = load_country_registry()
+    country_name = str(registry.at[selected_country_code, "country_name"])
+    timezone_str = str(registry.at[selected_country_code, "timezone"])
+    location = get_location(selected_country_code)
+    if location is None:
+        st.error(f"No forecast location for {country_name}")
         return
-
-    forecast = pd.DataFrame(forecast_data)
-    forecast = forecast.rename(columns={"power_kw": "power_gw"})
+    lat, lon = location
+    st.info(f"Displaying forecast in {country_name} local time (Timezone: {timezone_str})")
+
+    capacity = capacities.capacity_per_country[selected_country_code]
+
+    # read the forecast from the latest snapshot, or fetch it if it isn't there
+    snapshot = load_latest_snapshot()
+    forecast_hour = None
+    if snapshot is not None and selected_country_code in set(snapshot.forecasts["country_code"]):
+        forecast_hour = snapshot.forecast_hour
+        with timed("country_filter", country_code=selected_country_code):
+            forecasts = snapshot.forecasts
+            forecast = forecasts[forecasts["country_code"] == selected_country_code]
+            forecast = forecast.set_index("timestamp")[["power_gw"]]
+    elif multi_point_forecasts and selected_country_code in load_country_cells():
+        # large countries are forecast over a grid of cells, see `cells.py`
+        site = (country_name, capacity, lat, lon)
+        cell_forecasts = get_country_forecasts({selected_country_code: site})
+
+        if cell_forecasts is None:
+            st.error(f"Unable to get forecast for {country_name}")
+            return
+
+        forecast = cell_forecasts.set_index("timestamp")[["power_gw"]]
+    else:
+        forecast_data = get_forecast(country_name, capacity, lat, lon)
+
+        if forecast_data is None:
+            st.error(f"Unable to get forecast for {country_name}")
+            return
+
+        forecast_hour = served_forecast_hour(capacity, lat, lon)
+        forecast = smooth_predictions(forecast_data)
+        forecast = forecast.rename(columns={"power_kw": "power_gw"})
 
     # Convert timestamps to local time
     forecast = convert_utc_to_local_time(forecast, timezone_str)
 
     # plot in ploty
-    st.write(f"{country.name} Solar Forecast, capacity of {capacity} GW.")
+    st.write(f"{country_name} Solar Forecast, capacity of {capacity} GW.")
     fig = go.Figure(
         data=go.Scatter(
             x=forecast.index,
@@ -259,10 +168,13 @@ def country_page() -> None:
         yaxis_title="Power [GW]",
         xaxis_title="Local Time",
         yaxis_range=[0, None],
-        title=f"Solar Forecast for {country.name} (Local Time)",
+        title=f"Solar Forecast for {country_name} (Local Time)",
     )
 
-    st.plotly_chart(fig)
+    with timed("country_render", country_code=selected_country_code):
+        st.plotly_chart(fig)
+    if forecast_hour is not None:
+        show_forecast_age(forecast_hour)
 
     # Show forecast data table with local time
     with st.expander("View Forecast Data"):
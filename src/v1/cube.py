@@ -0,0 +1,154 @@
+"""Forecasts for every country as dense `timestamp x country` arrays.
+
+The pages slice the forecasts by time on every interaction. Reshaping the long forecasts
+once into arrays, with sorted timestamp and country indices, makes each of those an array
+slice rather than a filter, groupby or pivot of the long dataframe.
+"""
+
+import functools
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from metrics import timed
+from regions import region_membership
+
+# countries shown in the stacked global chart, the others are summed as `Other`
+top_countries_n = 10
+
+
+@dataclass(frozen=True)
+class ForecastCube:
+    """Forecasts as arrays with a row per timestamp and a column per country.
+
+    Countries without a forecast at a timestamp are NaN.
+    """
+
+    timestamps: pd.DatetimeIndex
+    country_codes: pd.Index
+    power_gw: np.ndarray
+    power_percentage: np.ndarray
+
+    @functools.cached_property
+    def total_gw(self) -> np.ndarray:
+        """The total forecast of all countries, for each timestamp."""
+        total_gw: np.ndarray = np.nansum(self.power_gw, axis=1)
+        return total_gw
+
+    def total_percentage(self, capacity_per_country: Mapping[str, float]) -> np.ndarray:
+        """The total forecast, as a percentage of the capacity of the countries in the cube.
+
+        Countries without a forecast are left out of the capacity, as they are of the total.
+        """
+        capacity_gw = sum(capacity_per_country[code] for code in self.country_codes)
+        total_percentage: np.ndarray = self.total_gw / capacity_gw * 100
+        return total_percentage
+
+    def nearest_timestamp_index(self, timestamp: pd.Timestamp) -> int:
+        """Find the index of the timestamp closest to a time, ties going to the earlier one."""
+        timestamps = self.timestamps
+        i = int(timestamps.searchsorted(timestamp))
+        if i == len(timestamps):
+            return i - 1
+        if i > 0 and timestamp - timestamps[i - 1] <= timestamps[i] - timestamp:
+            return i - 1
+        return i
+
+    def values_at(
+        self,
+        i: int | np.ndarray,
+        country_codes: list[str],
+        normalized: bool = False,
+    ) -> np.ndarray:
+        """The forecast of some countries at a timestamp index, NaN for unknown countries.
+
+        With an array of timestamp indices, returns a row for each of them.
+        """
+        values = self.power_percentage[i] if normalized else self.power_gw[i]
+        indexer = self.country_codes.get_indexer(pd.Index(country_codes))
+        return np.where(indexer >= 0, values[..., indexer], np.nan)
+
+    def top_countries(self, n: int) -> pd.DataFrame:
+        """The forecast of the n countries with the most generation, and of all the others.
+
+        Returns a dataframe indexed by timestamp, with a column per top country, and an
+        `Other` column if there are any other countries.
+        """
+        power_gw = np.nan_to_num(self.power_gw)
+        # stable sort, so ties keep the order of the country codes
+        order = np.argsort(-power_gw.sum(axis=0), kind="stable")
+        top, other = order[:n], order[n:]
+
+        top_countries = pd.DataFrame(
+            power_gw[:, top],
+            index=self.timestamps,
+            columns=self.country_codes[top],
+        )
+        if len(other) > 0:
+            top_countries["Other"] = power_gw[:, other].sum(axis=1)
+        return top_countries
+
+
+@dataclass(frozen=True)
+class GlobalAggregates:
+    """The global forecast, computed once per forecast run and shared by every page view.
+
+    Attributes:
+        total: The total forecast of all countries, indexed by timestamp, in GW in a
+            `power_gw` column
+        top_countries: The forecast of the top countries and of all others, see
+            `ForecastCube.top_countries`
+        regions: The total forecast of each region, indexed by timestamp, with a column per
+            region, see `regions.py`
+    """
+
+    total: pd.DataFrame
+    top_countries: pd.DataFrame
+    regions: pd.DataFrame
+
+    @property
+    def timestamps(self) -> pd.DatetimeIndex:
+        """The timestamps of the forecast, in order."""
+        return pd.DatetimeIndex(self.total.index)
+
+
+def aggregate_forecasts(cube: ForecastCube, n: int = top_countries_n) -> GlobalAggregates:
+    """Compute the global aggregates of a forecast cube."""
+    with timed("aggregate", countries=len(cube.country_codes)):
+        membership = region_membership(cube.country_codes)
+        return GlobalAggregates(
+            total=pd.DataFrame({"power_gw": cube.total_gw}, index=cube.timestamps),
+            top_countries=cube.top_countries(n),
+            regions=pd.DataFrame(
+                membership.rollup(cube.power_gw),
+                index=cube.timestamps,
+                columns=membership.regions,
+            ),
+        )
+
+
+def build_forecast_cube(forecasts: pd.DataFrame) -> ForecastCube:
+    """Reshape long forecasts, with a row per timestamp and country, into a forecast cube."""
+    with timed("cube_build", rows=len(forecasts)):
+        timestamps, timestamp_index = np.unique(
+            forecasts["timestamp"].to_numpy(),
+            return_inverse=True,
+        )
+        country_codes, country_index = np.unique(
+            forecasts["country_code"].to_numpy(),
+            return_inverse=True,
+        )
+
+        shape = (len(timestamps), len(country_codes))
+        power_gw = np.full(shape, np.nan)
+        power_percentage = np.full(shape, np.nan)
+        power_gw[timestamp_index, country_index] = forecasts["power_gw"].to_numpy()
+        power_percentage[timestamp_index, country_index] = forecasts["power_percentage"].to_numpy()
+
+    return ForecastCube(
+        timestamps=pd.DatetimeIndex(timestamps),
+        country_codes=pd.Index(country_codes),
+        power_gw=power_gw,
+        power_percentage=power_percentage,
+    )
@@ -2,32 +2,42 @@
 
 The csv will countain
 country_code, capacity_gw, country_name, source
+
+Ember's long format release is large, so it is streamed and filtered while it is parsed,
+reading only the columns we need. The download is skipped if it has not changed since the
+last run, and the csv is only rewritten if its content changes.
+
+Run from the repo root:
+    python src/v1/data/get_solar_capacities.py
 """
 
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import IO, cast
+
 import pandas as pd
+import requests
+from loguru import logger
 
 url = (
     "https://storage.googleapis.com/emb-prod-bkt-publicdata/public-downloads/"
     "yearly_full_release_long_format.csv"
 )
 
-# read csv into pandas dataframe
-df = pd.read_csv(url)
+data_dir = "src/v1/data"
 
+capacities_path = Path(f"{data_dir}/solar_capacities.csv")
 
-# only select year 2024
-df = df[df["Year"] == 2024]
-# only select solar
-df = df[df["Category"] == "Capacity"]
-df = df[df["Variable"] == "Solar"]
+# the filtered Ember data and the validators of its download, to make conditional requests
+ember_cache_dir = Path(os.getenv("EMBER_CACHE_DIR", f"{data_dir}/cache/ember"))
 
-df = df.rename(
-    columns={"Value": "capacity_gw", "Area": "country_name", "ISO 3 code": "country_code"},
-)
-df = df[["country_code", "capacity_gw", "country_name"]]
-df["source"] = "Ember"
+ember_year = 2024
+ember_columns = ["Area", "ISO 3 code", "Year", "Category", "Variable", "Value"]
 
-df.set_index("country_code", inplace=True)
+# rows of the long format file parsed at a time
+chunk_rows = 100_000
 
 # manually add some countries not already present in the Ember dataset
 # Additional countries with reliable sources from Wikipedia/Ember 2024 data
@@ -722,12 +732,114 @@ manual_countries = {
     },
 }
 
-manual_countries_df = pd.DataFrame.from_dict(manual_countries, orient="index")
-manual_countries_df.index.name = "country_code"
 
-df = pd.concat([df, manual_countries_df])
+def read_ember_capacities(csv: IO[str] | IO[bytes], chunksize: int = chunk_rows) -> pd.DataFrame:
+    """Read the solar capacities from Ember's long format csv, a chunk at a time.
+
+    Only the columns we need are parsed, and each chunk is filtered before the next is read,
+    so the whole file is never in memory.
+    """
+    filtered = []
+    for chunk in pd.read_csv(
+        csv,
+        usecols=ember_columns,
+        dtype={"Area": str, "ISO 3 code": str, "Category": str, "Variable": str},
+        chunksize=chunksize,
+    ):
+        is_solar_capacity = (
+            (chunk["Year"] == ember_year)
+            & (chunk["Category"] == "Capacity")
+            & (chunk["Variable"] == "Solar")
+        )
+        filtered.append(chunk[is_solar_capacity])
+
+    df = pd.concat(filtered)
+    df = df.rename(
+        columns={"Value": "capacity_gw", "Area": "country_name", "ISO 3 code": "country_code"},
+    )
+    return df[["country_code", "capacity_gw", "country_name"]].reset_index(drop=True)
+
+
+def fetch_ember_capacities(
+    ember_url: str = url,
+    cache_dir: Path = ember_cache_dir,
+    chunksize: int = chunk_rows,
+) -> pd.DataFrame:
+    """Get the solar capacities from Ember, downloading them only if they have changed.
+
+    The filtered capacities are kept in `cache_dir`, with the ETag and Last-Modified of their
+    download, and are used as they are if the server says the file has not changed.
+    """
+    capacities_cache = cache_dir / "solar_capacities.csv"
+    validators_path = cache_dir / "validators.json"
+
+    headers = {}
+    if capacities_cache.exists() and validators_path.exists():
+        validators = json.loads(validators_path.read_text())
+        if validators.get("url") == ember_url:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+    with requests.get(ember_url, headers=headers, stream=True, timeout=60) as r:
+        if r.status_code == 304:
+            logger.info("Ember data has not changed, using the cached capacities")
+            return pd.read_csv(capacities_cache)
+        r.raise_for_status()
+
+        logger.info("Downloading Ember data")
+        r.raw.decode_content = True
+        # the raw response is a binary file, that urllib3 doesn't type as one
+        df = read_ember_capacities(cast("IO[bytes]", r.raw), chunksize=chunksize)
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        df.to_csv(capacities_cache, index=False)
+        validators = {
+            "url": ember_url,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+        validators_path.write_text(json.dumps(validators, indent=2))
+
+    return df
+
+
+def build_capacities(ember: pd.DataFrame) -> pd.DataFrame:
+    """Combine the Ember capacities with the manually added countries."""
+    df = ember.set_index("country_code")
+    df["source"] = "Ember"
+
+    manual_countries_df = pd.DataFrame.from_dict(manual_countries, orient="index")
+    manual_countries_df.index.name = "country_code"
+
+    df = pd.concat([df, manual_countries_df])
+
+    # remove duplicate indices and will keep the last entry [which should be the manually added one]
+    return df[~df.index.duplicated(keep="last")]
+
+
+def write_if_changed(df: pd.DataFrame, path: Path = capacities_path) -> bool:
+    """Write the capacities csv, only if its content has changed. Returns if it was written."""
+    content = df.to_csv()
+    if path.exists() and path.read_text() == content:
+        return False
+    path.write_text(content)
+    return True
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Update the solar capacities from Ember.")
+    parser.add_argument("--url", default=url, help="Ember long format release csv")
+    args = parser.parse_args()
+
+    df = build_capacities(fetch_ember_capacities(args.url))
+    if write_if_changed(df):
+        logger.info(f"Updated {capacities_path}")
+    else:
+        logger.info(f"{capacities_path} is up to date")
 
-# remove duplicate indices and will keep the last entry [which should be the manually added one]
-df = df[~df.index.duplicated(keep="last")]
 
-df.to_csv("src/v1/data/solar_capacities.csv")
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,542 @@
 """Functions to get solar forecast data."""
 
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any
+
+import numpy as np
 import pandas as pd
 import requests
 import streamlit as st
-from scipy.signal import savgol_filter
+from cache import (
+    current_forecast_hour,
+    forecast_hour_age,
+    get_forecast_cache,
+    max_stale_hours,
+    site_key,
+)
+from cells import combine_cells, expand_sites, multi_point_forecasts, site_country
+from client import BatchNotSupportedError, get_client
+from loguru import logger
+from metrics import timed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 data_dir = "src/v1/data"
 
+# maximum number of forecast requests in flight at once
+max_in_flight = int(os.getenv("FORECAST_MAX_IN_FLIGHT", "16"))
 
-@st.cache_data(ttl="1h")
-def get_forecast(
-    name: str,
-    capacity: float,
-    lat: float,
-    lon: float,
-) -> pd.DataFrame | None:
-    """Get solar forecast for a given location and capacity."""
-    if capacity == 0:
-        return None
+# maximum number of sites in one batch request, 1 turns batching off
+forecast_batch_size = int(os.getenv("FORECAST_BATCH_SIZE", "1"))
 
-    site = {
+# how long the pages wait for live forecasts before showing the countries that have arrived,
+# 0 waits for all of them
+live_deadline_seconds = float(os.getenv("FORECAST_DEADLINE_SECONDS", "8"))
+
+# fetch forecasts per unit of capacity at locations snapped to the weather model grid,
+# and scale them by capacity when they are read. The model output is linear in capacity,
+# so this lets capacities change freely and lets nearby sites share one request.
+normalised_forecasts = os.getenv("FORECAST_NORMALISED", "0") == "1"
+weather_grid_degrees = float(os.getenv("FORECAST_GRID_DEGREES", "0.25"))
+
+# background refreshes of stale cached forecasts
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="forecast-refresh")
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+
+# requests in flight, and all the requests of the future fetching each one, so that reruns
+# after a deadline wait on the requests already in flight rather than sending them again
+_in_flight: dict[
+    tuple[float, float, float],
+    tuple[Future[Any], list[tuple[float, float, float]]],
+] = {}
+_in_flight_lock = threading.Lock()
+
+
+def report_error(message: str) -> None:
+    """Log an error, and show it on the page too when running in the app."""
+    logger.warning(message)
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        st.error(message)
+
+
+def make_site(capacity: float, lat: float, lon: float) -> dict[str, float]:
+    """Make the site we send to the API."""
+    return {
         "latitude": lat,
         "longitude": lon,
         "capacity_kwp": capacity,
         "tilt": abs(lat) / 2,
         "orientation": 180 if lat > 0 else 0,
     }
-    now = pd.Timestamp.utcnow().floor("h").replace(tzinfo=None).isoformat()
-    data = {"site": site, "timestamp": now}
-    url = "https://open.quartz.solar/forecast/"
 
-    r = requests.post(url, json=data, timeout=20)
 
-    if r.status_code == 200:
-        forecast = r.json()
-        predictions: pd.DataFrame = pd.DataFrame(forecast["predictions"])
+def smooth_predictions(predictions: pd.DataFrame) -> pd.DataFrame:
+    """Smooth out some of the predictions, keeping zeros (e.g. at night) as zero."""
+    from scipy.signal import savgol_filter
 
-        # smooth out some of the predictions
-        # ideally we would take this out, and the ML model would do this
+    # ideally we would take this out, and the ML model would do this
+    with timed("smooth", forecasts=1):
         zeros = predictions["power_kw"] == 0
         predictions = predictions[["power_kw"]].apply(savgol_filter, window_length=10, polyorder=2)
         predictions.loc[zeros, "power_kw"] = 0
 
-        return predictions
+    return predictions
+
+
+def smooth_forecasts(forecasts: list[pd.DataFrame]) -> list[pd.DataFrame]:
+    """Smooth many forecasts at once, the same as `smooth_predictions` does one at a time.
+
+    Forecasts with the same number of timestamps are stacked into one array, and smoothed
+    along the time axis in a single call.
+    """
+    from scipy.signal import savgol_filter
+
+    positions_per_length: dict[int, list[int]] = {}
+    for i, forecast in enumerate(forecasts):
+        positions_per_length.setdefault(len(forecast), []).append(i)
+
+    smoothed: list[pd.DataFrame] = list(forecasts)
+    with timed("smooth", forecasts=len(forecasts)):
+        for positions in positions_per_length.values():
+            power_kw = np.stack(
+                [forecasts[i]["power_kw"].to_numpy(dtype=float) for i in positions],
+            )
+            smoothed_kw = savgol_filter(power_kw, window_length=10, polyorder=2, axis=1)
+            smoothed_kw[power_kw == 0] = 0
+            for i, row in zip(positions, smoothed_kw, strict=True):
+                smoothed[i] = pd.DataFrame({"power_kw": row}, index=forecasts[i].index)
+
+    return smoothed
+
+
+def fetch_forecast(
+    capacity: float,
+    lat: float,
+    lon: float,
+    forecast_hour: str,
+) -> pd.DataFrame | None:
+    """Fetch a solar forecast from the API, returning None if the request fails."""
+    return get_client().get_predictions(make_site(capacity, lat, lon), forecast_hour)
+
+
+def fetch_forecasts(
+    sites: list[tuple[float, float, float]],
+    forecast_hour: str,
+) -> list[pd.DataFrame | None]:
+    """Fetch solar forecasts for many `(capacity, lat, lon)` sites in one batch request.
+
+    Raises:
+        BatchNotSupportedError: If the API does not support batch requests
+    """
+    batch = [make_site(capacity, lat, lon) for capacity, lat, lon in sites]
+    return get_client().get_predictions_batch(batch, forecast_hour)
+
+
+def normalise_site(capacity: float, lat: float, lon: float) -> tuple[float, float, float]:
+    """Get the `(capacity, lat, lon)` to actually fetch a forecast for.
+
+    In normalised mode this is a unit capacity at the nearest weather model grid point,
+    otherwise it is the site itself.
+    """
+    if not normalised_forecasts:
+        return capacity, lat, lon
+
+    lat = round(round(lat / weather_grid_degrees) * weather_grid_degrees, 6)
+    lon = round(round(lon / weather_grid_degrees) * weather_grid_degrees, 6)
+    return 1.0, lat, lon
+
+
+def get_servable_forecast(key: str) -> tuple[str, pd.DataFrame] | None:
+    """Get the cached forecast hour and forecast for a site, if it is recent enough to serve."""
+    cached = get_forecast_cache().get(key)
+    if cached is None or forecast_hour_age(cached[0]) > max_stale_hours:
+        return None
+    return cached
+
+
+def served_forecast_hour(capacity: float, lat: float, lon: float) -> str | None:
+    """The forecast hour that `get_forecast` serves for a site, or None if it is not cached."""
+    cached = get_servable_forecast(site_key(*normalise_site(capacity, lat, lon)))
+    return None if cached is None else cached[0]
+
+
+def get_forecast(
+    name: str,
+    capacity: float,
+    lat: float,
+    lon: float,
+) -> pd.DataFrame | None:
+    """Get solar forecast for a given location and capacity.
+
+    Forecasts are served from the persistent cache. If the cached forecast is from an older
+    forecast hour, it is returned straight away and refreshed in the background, unless it is
+    more than `max_stale_hours` old, when it is fetched again as if it was not cached.
+
+    The forecast is not smoothed, see `smooth_predictions` and `smooth_forecasts`.
+    """
+    if capacity == 0:
+        return None
+
+    fetch_capacity, fetch_lat, fetch_lon = normalise_site(capacity, lat, lon)
+    cache = get_forecast_cache()
+    key = site_key(fetch_capacity, fetch_lat, fetch_lon)
+    forecast_hour = current_forecast_hour()
+
+    cached = get_servable_forecast(key)
+    if cached is not None:
+        cached_hour, cached_predictions = cached
+        if cached_hour != forecast_hour:
+            refresh_in_background(key, name, fetch_capacity, fetch_lat, fetch_lon)
+        return cached_predictions * (capacity / fetch_capacity)
+
+    predictions = fetch_forecast(fetch_capacity, fetch_lat, fetch_lon, forecast_hour)
+    if predictions is None:
+        report_error(f"Error fetching forecast for {name}")
+        return None
+
+    cache.put(key, forecast_hour, predictions)
+    return predictions * (capacity / fetch_capacity)
+
+
+def refresh_forecast(
+    name: str,
+    capacity: float,
+    lat: float,
+    lon: float,
+) -> pd.DataFrame | None:
+    """Fetch a fresh forecast for the current forecast hour, and store it in the cache."""
+    if capacity == 0:
+        return None
+
+    fetch_capacity, fetch_lat, fetch_lon = normalise_site(capacity, lat, lon)
+    forecast_hour = current_forecast_hour()
+    predictions = fetch_forecast(fetch_capacity, fetch_lat, fetch_lon, forecast_hour)
+    if predictions is None:
+        logger.warning(f"Error fetching forecast for {name}")
+        return None
+
+    key = site_key(fetch_capacity, fetch_lat, fetch_lon)
+    get_forecast_cache().put(key, forecast_hour, predictions)
+    return predictions * (capacity / fetch_capacity)
+
+
+def refresh_forecasts(sites: list[tuple[float, float, float]]) -> list[pd.DataFrame | None]:
+    """Fetch fresh forecasts for many sites in one batch request, and store them in the cache.
+
+    The sites should already be normalised, see `normalise_site`.
+
+    Raises:
+        BatchNotSupportedError: If the API does not support batch requests
+    """
+    forecast_hour = current_forecast_hour()
+    forecasts = fetch_forecasts(sites, forecast_hour)
+
+    cache = get_forecast_cache()
+    for site, predictions in zip(sites, forecasts, strict=True):
+        if predictions is None:
+            logger.warning(f"Error fetching forecast for site {site}")
+        else:
+            cache.put(site_key(*site), forecast_hour, predictions)
+
+    return forecasts
+
+
+def refresh_in_background(
+    key: str,
+    name: str,
+    capacity: float,
+    lat: float,
+    lon: float,
+) -> None:
+    """Fetch a forecast in the background and store it in the cache.
+
+    Only one refresh per site runs at a time, repeated calls while it is running do nothing.
+    """
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh() -> None:
+        try:
+            refresh_forecast(name, capacity, lat, lon)
+        except requests.RequestException as e:
+            logger.warning(f"Error refreshing forecast for {name}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    _refresh_executor.submit(refresh)
+
+
+def track_in_flight(future: Future[Any], fetching: list[tuple[float, float, float]]) -> None:
+    """Record the requests a future is fetching, until it is done."""
+
+    def forget(_: Future[Any]) -> None:
+        with _in_flight_lock:
+            for request in fetching:
+                if request in _in_flight and _in_flight[request][0] is future:
+                    del _in_flight[request]
+
+    with _in_flight_lock:
+        for request in fetching:
+            _in_flight[request] = (future, fetching)
+    future.add_done_callback(forget)
+
+
+def get_forecasts(
+    sites: dict[str, tuple[str, float, float, float]],
+    max_workers: int = max_in_flight,
+    fresh: bool = False,
+    batch_size: int = forecast_batch_size,
+    deadline_seconds: float | None = None,
+) -> Iterator[tuple[str, pd.DataFrame | None]]:
+    """Get solar forecasts for many sites concurrently.
+
+    All sites are submitted at once and at most `max_workers` requests are in flight.
+    Results are yielded as soon as each one finishes, so the caller can report progress.
+
+    If the deadline passes first, the sites still being fetched are not yielded. Their requests
+    carry on in the background and store the forecasts in the cache, so they are there the
+    next time they are asked for. Until then, asking for them again waits on the same requests,
+    rather than sending new ones.
+
+    If `batch_size` is more than one, sites that need fetching are sent in batch requests of
+    up to that many sites. The first batch finds out if the API supports batches,
+    and if it does not we fall back to single site requests.
+
+    Args:
+        sites: Mapping of a key (e.g. country code) to `(name, capacity, lat, lon)`
+        max_workers: Maximum number of concurrent requests
+        fresh: Always fetch new forecasts, rather than serving them from the cache
+        batch_size: Maximum number of sites per request
+        deadline_seconds: How long to wait for all the forecasts, None to wait for all of them
+
+    Yields:
+        Tuples of `(key, forecast)`, where forecast is None if it could not be fetched.
+        Forecasts are not smoothed, so that they can all be smoothed at once.
+    """
+    # let the worker threads use the caller's streamlit context, so errors are shown
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    def attach_context() -> None:
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    fetch = refresh_forecast if fresh else get_forecast
+
+    # sites that need the same request are only fetched once, and scaled by their capacity
+    sites_per_request: dict[tuple[float, float, float], list[str]] = {}
+    for key, (_, capacity, lat, lon) in sites.items():
+        if capacity == 0:
+            yield key, None
+            continue
+        sites_per_request.setdefault(normalise_site(capacity, lat, lon), []).append(key)
+
+    # only batch the requests that are not already in the cache
+    use_batches = batch_size > 1 and get_client().batch_supported is not False
+    batched: list[tuple[float, float, float]] = []
+    single: list[tuple[float, float, float]] = []
+    for request in sites_per_request:
+        if use_batches and (fresh or get_servable_forecast(site_key(*request)) is None):
+            batched.append(request)
+        else:
+            single.append(request)
+
+    deadline = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+    executor = ThreadPoolExecutor(max_workers=max_workers, initializer=attach_context)
+    futures: dict[Future[Any], list[tuple[float, float, float]]] = {}
+    try:
+        batch_futures: set[Future[Any]] = set()
+
+        def submit_single(to_fetch: list[tuple[float, float, float]]) -> None:
+            for request in to_fetch:
+                name = sites[sites_per_request[request][0]][0]
+                future = executor.submit(fetch, name, *request)
+                futures[future] = [request]
+                track_in_flight(future, [request])
+
+        def submit_batches(to_fetch: list[tuple[float, float, float]]) -> None:
+            for i in range(0, len(to_fetch), batch_size):
+                chunk = to_fetch[i : i + batch_size]
+                future = executor.submit(refresh_forecasts, chunk)
+                futures[future] = chunk
+                batch_futures.add(future)
+                track_in_flight(future, chunk)
+
+        # wait on the requests still in flight from earlier calls, see `track_in_flight`
+        if not fresh:
+            with _in_flight_lock:
+                for request in [*single, *batched]:
+                    if request in _in_flight:
+                        future, fetching = _in_flight[request]
+                        futures[future] = fetching
+            waiting = {request for fetching in futures.values() for request in fetching}
+            single = [request for request in single if request not in waiting]
+            batched = [request for request in batched if request not in waiting]
+
+        submit_single(single)
+        # if we don't know yet, check the API supports batches before sending them all
+        if get_client().batch_supported is None:
+            submit_batches(batched[:batch_size])
+            batched = batched[batch_size:]
+        else:
+            submit_batches(batched)
+            batched = []
+
+        while futures:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.warning(
+                    f"Forecast deadline of {deadline_seconds} s passed, "
+                    f"with {len(futures)} requests still in flight",
+                )
+                break
+            for future in done:
+                fetched = futures.pop(future)
+                # futures from earlier calls can also fetch requests this call doesn't need
+                needed = [request for request in fetched if request in sites_per_request]
+                try:
+                    result = future.result()
+                except BatchNotSupportedError:
+                    submit_single(needed + batched)
+                    batched = []
+                    continue
+                except requests.RequestException:
+                    names = [sites[sites_per_request[r][0]][0] for r in needed]
+                    report_error(f"Error fetching forecast for {', '.join(names)}")
+                    result = [None] * len(fetched)
+
+                if future in batch_futures:
+                    submit_batches(batched)
+                    batched = []
+
+                forecasts = result if isinstance(result, list) else [result]
+                for request, forecast in zip(fetched, forecasts, strict=True):
+                    for key in sites_per_request.get(request, []):
+                        if forecast is None:
+                            yield key, None
+                        else:
+                            yield key, forecast * (sites[key][1] / request[0])
+    finally:
+        # don't wait for requests still in flight after the deadline
+        executor.shutdown(wait=not futures)
+
+
+def get_country_forecasts(
+    sites: dict[str, tuple[str, float, float, float]],
+    max_workers: int = max_in_flight,
+    fresh: bool = False,
+    progress: Callable[[int, str], None] | None = None,
+    multi_point: bool = multi_point_forecasts,
+    deadline_seconds: float | None = None,
+) -> pd.DataFrame | None:
+    """Get the smoothed and formatted forecasts for many countries.
+
+    Countries whose forecasts are not all fetched by the deadline are left out, see
+    `get_forecasts`.
+
+    Args:
+        sites: Mapping of country code to `(name, capacity, lat, lon)`, see `registry.get_sites`
+        max_workers: Maximum number of concurrent requests
+        fresh: Always fetch new forecasts, rather than serving them from the cache
+        progress: Called with the number of countries done and the name of the latest one
+        multi_point: Forecast large countries as the weighted sum of forecasts over a grid of
+            cells, rather than at one site, see `cells.py`
+        deadline_seconds: How long to wait for the forecasts, None to wait for all of them
+
+    Returns:
+        The forecasts as from `combine_forecasts`, or None if none could be fetched
+    """
+    if multi_point:
+        fetch_sites, weights = expand_sites(sites)
     else:
-        st.error(f"Error fetching forecast for {name}")
+        fetch_sites, weights = sites, dict.fromkeys(sites, 1.0)
+
+    # the forecasts and weights of each country's sites, until all of them are fetched
+    sites_left = Counter(site_country(key) for key in fetch_sites)
+    fetched_sites: dict[str, list[tuple[pd.DataFrame, float]]] = {}
+
+    fetched: dict[str, pd.DataFrame] = {}
+    countries_done = 0
+    with timed("fetch", countries=len(sites), sites=len(fetch_sites), fresh=fresh):
+        for key, forecast_data in get_forecasts(
+            fetch_sites,
+            max_workers=max_workers,
+            fresh=fresh,
+            deadline_seconds=deadline_seconds,
+        ):
+            country_code = site_country(key)
+            if forecast_data is not None:
+                fetched_sites.setdefault(country_code, []).append((forecast_data, weights[key]))
+
+            sites_left[country_code] -= 1
+            if sites_left[country_code] > 0:
+                continue
+            countries_done += 1
+            if progress is not None:
+                progress(countries_done, f"{sites[country_code][0]} ({country_code})")
+            if country_code in fetched_sites:
+                forecasts, site_weights = zip(*fetched_sites.pop(country_code), strict=True)
+                fetched[country_code] = combine_cells(list(forecasts), list(site_weights))
+
+    # smooth all the forecasts together, once they have all been fetched
+    smoothed = smooth_forecasts(list(fetched.values()))
+
+    forecast_per_country: dict[str, pd.DataFrame] = {}
+    with timed("format", countries=len(fetched)):
+        for country_code, forecast_data in zip(fetched, smoothed, strict=True):
+            forecast = format_forecast(forecast_data, sites[country_code][1])
+            if forecast is not None:
+                forecast_per_country[country_code] = forecast
+
+    if not forecast_per_country:
+        return None
+    return combine_forecasts(forecast_per_country)
+
+
+def format_forecast(forecast_data: pd.DataFrame, capacity: float) -> pd.DataFrame | None:
+    """Format a forecast with power in GW and as a percentage of capacity.
+
+    Returns None if the forecast is not in the expected format.
+    """
+    forecast = pd.DataFrame(forecast_data)
+    # Ensure timestamp column is parsed and timezone-aware (UTC)
+    if "timestamp" in forecast.columns:
+        forecast["timestamp"] = pd.to_datetime(forecast["timestamp"], utc=True)
+        forecast = forecast.set_index("timestamp").sort_index()
+
+    # Convert units explicitly: API returns kW (power_kw) -> convert to GW
+    if "power_kw" in forecast.columns:
+        # We don't need to scale the values as we provide the capacity in GW
+        # (it should be in kW)
+        forecast["power_gw"] = forecast["power_kw"].astype(float)
+    elif "power_gw" not in forecast.columns:
+        # unexpected format
         return None
+
+    forecast["power_percentage"] = forecast["power_gw"] / float(capacity) * 100
+
+    return forecast
+
+
+def combine_forecasts(forecast_per_country: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Combine formatted forecasts into one long dataframe, with a row per timestamp and country."""
+    with timed("combine", countries=len(forecast_per_country)):
+        all_forecasts: list[pd.DataFrame] = []
+        for country_code, forecast in forecast_per_country.items():
+            forecast["country_code"] = country_code
+            all_forecasts.append(forecast)
+
+        all_forecasts_df = pd.concat(all_forecasts, ignore_index=False)
+        all_forecasts_df.index.name = "timestamp"
+        all_forecasts_df = all_forecasts_df.reset_index()
+        all_forecasts_df["timestamp"] = pd.to_datetime(all_forecasts_df["timestamp"])
+
+    return all_forecasts_df
@@ -0,0 +1,78 @@
+"""Simplified world geometries for the map, prepared at a few levels of detail.
+
+The full `countries.geojson` is much more detailed than the map can show, and carries over
+a hundred properties per country. For each level of detail we simplify the country borders
+together, so neighbouring countries still share their borders, round the coordinates to what
+the map can display, and keep only the country code and name.
+
+Rebuild them after changing `countries.geojson`, by running from the repo root:
+    python src/v1/geometry.py
+"""
+
+import functools
+import json
+from typing import Any
+
+from metrics import timed
+
+data_dir = "src/v1/data"
+
+# level of detail -> (simplification tolerance, coordinate precision), both in degrees
+detail_levels = {
+    "low": (1.0, 0.01),
+    "medium": (0.3, 0.01),
+    "high": (0.0, 0.001),
+}
+default_detail_level = "medium"
+
+
+def geometry_path(detail_level: str) -> str:
+    """Path of the world geometries for a level of detail."""
+    return f"{data_dir}/countries_{detail_level}.geojson"
+
+
+def build_world_geometries() -> None:
+    """Build the world geometries for every level of detail."""
+    import shapely
+    from registry import load_world
+
+    world = load_world()
+    geometries = world.geometry.values
+
+    for detail_level, (tolerance, precision) in detail_levels.items():
+        simplified = geometries
+        if tolerance > 0:
+            simplified = shapely.coverage_simplify(simplified, tolerance)
+        simplified = shapely.set_precision(simplified, precision)
+
+        features = [
+            {
+                "type": "Feature",
+                "id": country_code,
+                "properties": {"name": name},
+                "geometry": json.loads(shapely.to_geojson(geometry)),
+            }
+            for country_code, name, geometry in zip(
+                world["adm0_a3"],
+                world["name"],
+                simplified,
+                strict=True,
+            )
+        ]
+        with open(geometry_path(detail_level), "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"))
+
+
+@functools.cache
+def load_world_geojson(detail_level: str = default_detail_level) -> dict[str, Any]:
+    """Load the world geometries for a level of detail, once per process.
+
+    Each feature's `id` is the country's ISO alpha-3 code.
+    """
+    with timed("geometry_load", detail_level=detail_level), open(geometry_path(detail_level)) as f:
+        geojson: dict[str, Any] = json.load(f)
+    return geojson
+
+
+if __name__ == "__main__":
+    build_world_geometries()
@@ -1,21 +1,27 @@
 """A Streamlit app to show global solar forecast."""
 
-import json
-import warnings
+import os
 from pathlib import Path
 
-import geopandas as gpd
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import pycountry
 import streamlit as st
+from capacities import CapacityTable, load_capacity_table
 from constants import ocf_palette
-from country import country_page
-from forecast import get_forecast
-
-data_dir = "src/v1/data"
-
-
+from country import country_page, show_forecast_age
+from cube import aggregate_forecasts, build_forecast_cube, top_countries_n
+from forecast import get_country_forecasts, live_deadline_seconds
+from geometry import default_detail_level, detail_levels
+from metrics import configure_logging, metrics_port, start_metrics_server, timed
+from profiling import profiled
+from registry import get_sites
+from snapshot import load_latest_snapshot, start_scheduler
+from world_map import get_map_country_codes, make_animated_map_figure, make_map_figure
+
+
+@profiled
+@timed("main_page")
 def main_page() -> None:
     """Main page, show a map of the world with the solar forecast."""
     # Add title with logo beside it
@@ -41,122 +47,54 @@ def main_page() -> None:
         "which uses live weather data.",
     )
 
-    # Lets load a map of the world
-    world = gpd.read_file(f"{data_dir}/countries.geojson")
-    # Ensure we have a column with ISO A3 country codes
-    possible_cols = ["adm0_a3", "ADM0_A3", "iso_a3", "ISO_A3", "sov_a3", "gu_a3"]
-    iso_col = next((c for c in possible_cols if c in world.columns), None)
-    if iso_col is None:
-        raise KeyError(f"No ISO country code column found. Columns: {world.columns.tolist()}")
-    world = world.rename(columns={iso_col: "adm0_a3"})
-    # Fix known incorrect country codes
-    world["adm0_a3"] = world["adm0_a3"].replace({"SDS": "SSD"})
-
-    # Get list of countries and their solar capacities now from the Ember API
-    solar_capacity_per_country_df = pd.read_csv(
-        f"{data_dir}/solar_capacities.csv",
-        index_col=0,
-    )
-
-    # remove nans in index
-    solar_capacity_per_country_df["temp"] = solar_capacity_per_country_df.index
-    solar_capacity_per_country_df.dropna(subset=["temp"], inplace=True)
-
-    # add column with country code and name
-    solar_capacity_per_country_df["country_code_and_name"] = (
-        solar_capacity_per_country_df.index + " - " + solar_capacity_per_country_df["country_name"]
-    )
-
-    # convert to dict
-    solar_capacity_per_country = solar_capacity_per_country_df.to_dict()["capacity_gw"]
-    global_solar_capacity = solar_capacity_per_country_df["capacity_gw"].sum()
-
-    # run forecast for each country
-    forecast_per_country: dict[str, pd.DataFrame] = {}
-    my_bar = st.progress(0)
-    countries = list(pycountry.countries)
-    for i in range(len(countries)):
-        my_bar.progress(
-            int(i / len(countries) * 100),
-            f"Loading Solar forecast for {countries[i].name} "
-            f"({countries[i].alpha_3}) "
-            f"({i + 1}/{len(countries)})",
-        )
-        country = countries[i]
-
-        if country.alpha_3 not in solar_capacity_per_country:
-            continue
-
-        country_map = world[world["adm0_a3"] == country.alpha_3]
-        if country_map.empty:
-            continue
-
-        # get centroid of country
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore")
-            centroid = country_map.geometry.to_crs(crs="EPSG:4326").centroid
-
-        lat = centroid.y.values[0]
-        lon = centroid.x.values[0]
-
-        capacity = solar_capacity_per_country[country.alpha_3]
-        if capacity == 0.0:
-            continue
-        forecast_data = get_forecast(country.name, capacity, lat, lon)
-
-        if forecast_data is not None:
-            forecast = pd.DataFrame(forecast_data)
-            # Ensure timestamp column is parsed and timezone-aware (UTC)
-            if "timestamp" in forecast.columns:
-                forecast["timestamp"] = pd.to_datetime(forecast["timestamp"], utc=True)
-                forecast = forecast.set_index("timestamp").sort_index()
-
-            # Convert units explicitly: API returns kW (power_kw) -> convert to GW
-            if "power_kw" in forecast.columns:
-                # We don't need to scale the values as we provide the capacity in GW
-                # (it should be in kW)
-                forecast["power_gw"] = forecast["power_kw"].astype(float)
-            elif "power_gw" not in forecast.columns:
-                # unexpected format; skip this country
-                continue
-
-            if capacity == 0.0:
-                forecast["power_percentage"] = None
-            else:
-                forecast["power_percentage"] = forecast["power_gw"] / float(capacity) * 100
-
-            forecast_per_country[country.alpha_3] = forecast
-
-    my_bar.progress(100, "Loaded all forecasts.")
-    my_bar.empty()
-
-    # format forecast into pandas dataframe
-    all_forecasts: list[pd.DataFrame] = []
-    for country_code, forecast in forecast_per_country.items():
-        forecast["country_code"] = country_code
-        all_forecasts.append(forecast)
-
-    all_forecasts_df = pd.concat(all_forecasts, ignore_index=False)
-    all_forecasts_df.index.name = "timestamp"
-    all_forecasts_df = all_forecasts_df.reset_index()
+    # Get list of countries and their solar capacities, from the Ember data
+    capacities = load_capacity_table()
 
-    # plot the total amount forecasted and stacked chart option
-    total_forecast = all_forecasts_df[["timestamp", "power_gw"]]
-    total_forecast = total_forecast.groupby(["timestamp"]).sum().reset_index()
+    # read the forecasts from the latest snapshot, or fetch them if there isn't one yet
+    snapshot = load_latest_snapshot()
+    # the global total and top countries are computed once per snapshot, not on every rerun
+    live_forecasts = None
+    if snapshot is not None:
+        cube = snapshot.cube
+        aggregates = snapshot.aggregates
+    else:
+        live_forecasts = get_live_forecasts()
+        if live_forecasts is None:
+            st.error("No forecast data available")
+            return
+        cube = build_forecast_cube(live_forecasts)
+        aggregates = aggregate_forecasts(cube)
 
     st.write(
-        f"Total global solar capacity is {global_solar_capacity:.2f} GW. "
+        f"Total global solar capacity is {capacities.global_capacity_gw:.2f} GW. "
         "Of course this number is always changing so please see the `Capacities` tab "
         "for actual the numbers we have used. ",
     )
+    if live_forecasts is not None:
+        show_missing_countries(live_forecasts, capacities)
+
     # Toggle to show stacked chart (top N countries + Other)
-    show_stacked = st.checkbox("Show stacked global chart (top 10 countries)", value=False)
+    show_stacked = st.checkbox(
+        f"Show stacked global chart (top {top_countries_n} countries)",
+        value=False,
+    )
 
     if not show_stacked:
+        # each region's forecast is rolled up with the global one, see `regions.py`
+        region = st.selectbox(
+            "Region",
+            options=["World", *aggregates.regions.columns],
+            help="Show the total forecast of a continent or group of countries",
+        )
+        if region == "World":
+            power_gw, title = aggregates.total["power_gw"], "Global Solar Power Forecast"
+        else:
+            power_gw, title = aggregates.regions[region], f"{region} Solar Power Forecast"
+
         fig = go.Figure(
             data=go.Scatter(
-                x=total_forecast["timestamp"],
-                y=total_forecast["power_gw"],
+                x=aggregates.timestamps,
+                y=power_gw,
                 marker_color="#FF4901",
             ),
         )
@@ -164,29 +102,12 @@ def main_page() -> None:
             yaxis_title="Power [GW]",
             xaxis_title="Time (UTC)",
             yaxis_range=[0, None],
-            title="Global Solar Power Forecast",
+            title=title,
         )
         st.plotly_chart(fig)
     else:
-        # Prepare stacked data: pivot per country
-        pivot = all_forecasts_df.pivot_table(
-            index="timestamp",
-            columns="country_code",
-            values="power_gw",
-            aggfunc="sum",
-        ).fillna(0)
-
-        # pick top N countries by peak contribution
-        # Reduced to 10 for readability
-
-        top_n = 10
-        country_sums = pivot.sum().sort_values(ascending=False)
-        top_countries = list(country_sums.head(top_n).index)
-        other_countries = [c for c in pivot.columns if c not in top_countries]
-
-        stacked_df = pivot[top_countries].copy()
-        if other_countries:
-            stacked_df["Other"] = pivot[other_countries].sum(axis=1)
+        # top N countries by total generation, and the rest as Other
+        stacked_df = aggregates.top_countries
 
         fig = go.Figure()
         cols = list(stacked_df.columns)  # type: ignore[arg-type]
@@ -210,17 +131,24 @@ def main_page() -> None:
             legend={"orientation": "h", "yanchor": "bottom", "y": 1.02, "xanchor": "right", "x": 1},
         )
         st.plotly_chart(fig)
+    if snapshot is not None:
+        show_forecast_age(snapshot.forecast_hour)
 
     # forecast map
-    all_forecasts_df["timestamp"] = pd.to_datetime(all_forecasts_df["timestamp"])
-    available_timestamps = sorted(all_forecasts_df["timestamp"].unique())
+    available_timestamps = aggregates.timestamps
 
     st.subheader("Solar Forecast Map")
     st.write("Use the slider below to view forecasts for different time horizons:")
 
+    animate = st.checkbox(
+        "Animate the map",
+        value=False,
+        help="Play and scrub through the forecast in your browser, without reloading the page",
+    )
+
     if len(available_timestamps) > 0:
         now = pd.Timestamp.utcnow().floor("h").replace(tzinfo=None)
-        hours_ahead = [(ts - now).total_seconds() / 3600 for ts in available_timestamps]
+        hours_ahead = (available_timestamps - now) / pd.Timedelta(hours=1)
 
         def format_time_label(hours: float) -> str:
             if hours <= 0:
@@ -231,33 +159,40 @@ def main_page() -> None:
                 days = int(hours // 24)
                 return f"+{days} day(s)"
 
-        selected_hours = st.slider(
-            "Select Forecast Time (hours from now)",
-            min_value=0.0,
-            max_value=max(hours_ahead),
-            value=0.0,
-            step=0.25,
-            format="%.1f h",
-            help="Move slider to see forecasts at different times",
-        )
-
-        # Find the closest timestamp index to the selected hours
-        selected_timestamp_index = min(
-            range(len(hours_ahead)),
-            key=lambda i: abs(hours_ahead[i] - selected_hours),
-        )
+        if animate:
+            hourly = st.checkbox("Hourly steps", value=True, help="Fewer frames load faster")
+
+            # the same times the slider can select, on the hour if hourly
+            is_frame = hours_ahead >= 0
+            if hourly:
+                is_frame &= available_timestamps.minute == 0
+            frame_indices = np.flatnonzero(is_frame)
+            if len(frame_indices) == 0:
+                frame_indices = np.arange(len(available_timestamps))
+        else:
+            selected_hours = st.slider(
+                "Select Forecast Time (hours from now)",
+                min_value=0.0,
+                max_value=float(hours_ahead.max()),
+                value=0.0,
+                step=0.25,
+                format="%.1f h",
+                help="Move slider to see forecasts at different times",
+            )
 
-        selected_timestamp = available_timestamps[selected_timestamp_index]
-        hours_from_now = hours_ahead[selected_timestamp_index]
-        time_label = format_time_label(hours_from_now)
+            # Find the closest timestamp index to the selected hours
+            selected_timestamp_index = cube.nearest_timestamp_index(
+                now + pd.Timedelta(hours=selected_hours),
+            )
 
-        st.info(
-            f"**Selected Time**: {time_label} | "
-            f"{selected_timestamp.strftime('%Y-%m-%d %H:%M')} UTC",
-        )
+            selected_timestamp = available_timestamps[selected_timestamp_index]
+            hours_from_now = hours_ahead[selected_timestamp_index]
+            time_label = format_time_label(hours_from_now)
 
-        selected_generation = all_forecasts_df[all_forecasts_df["timestamp"] == selected_timestamp]
-        selected_generation = selected_generation[["country_code", "power_gw", "power_percentage"]]
+            st.info(
+                f"**Selected Time**: {time_label} | "
+                f"{selected_timestamp.strftime('%Y-%m-%d %H:%M')} UTC",
+            )
     else:
         st.error("No forecast data available for the map")
         return
@@ -266,51 +201,118 @@ def main_page() -> None:
         "Normalised each countries solar forecast (0-100%)",
         value=False,
     )
-
-    world = world.merge(
-        selected_generation,
-        how="left",
-        left_on="adm0_a3",
-        right_on="country_code",
+    detail_level = st.select_slider(
+        "Map detail",
+        options=list(detail_levels),
+        value=default_detail_level,
+        help="Less detail makes the map faster to load, especially on mobile",
     )
 
-    shapes_dict = json.loads(world.to_json())
-
-    fig = go.Figure(
-        data=go.Choroplethmap(
-            geojson=shapes_dict,
-            locations=world.index,
-            z=world["power_percentage" if normalized else "power_gw"],
-            colorscale="Viridis",
-            colorbar_title="Power [%]" if normalized else "Power [GW]",
-            marker_opacity=0.5,
-            hovertemplate="<b>%{customdata}</b><br>Power: %{z:.2f} GW<extra></extra>",
-            customdata=world["country_name"]
-            if "country_name" in world.columns
-            else world["adm0_a3"],
-        ),
+    # only the values on the map change, the rest of the figure is built once per process
+    country_codes = get_map_country_codes(detail_level)
+    colorbar_title = "Power [%]" if normalized else "Power [GW]"
+
+    with timed("map_figure", animated=animate, detail_level=detail_level):
+        if animate:
+            fig = make_animated_map_figure(
+                detail_level,
+                frame_labels=list(available_timestamps[frame_indices].strftime("%a %H:%M")),
+                frame_z=cube.values_at(frame_indices, country_codes, normalized),
+                colorbar_title=colorbar_title,
+            )
+        else:
+            fig = make_map_figure(
+                detail_level,
+                z=cube.values_at(selected_timestamp_index, country_codes, normalized),
+                colorbar_title=colorbar_title,
+            )
+
+    # this serialises the figure, geometries and all, and sends it to the browser
+    with timed("map_render", animated=animate, detail_level=detail_level):
+        clicked_data = st.plotly_chart(fig, on_select="rerun", key="world_map")
+
+    if clicked_data and clicked_data["selection"]["points"]:
+        selected_point = clicked_data["selection"]["points"][0]
+        clicked_country_code = selected_point["location"]
+
+        if clicked_country_code in capacities.capacity_per_country:
+            st.session_state.selected_country_code = clicked_country_code
+            st.switch_page(country_page_ref)
+        else:
+            st.warning("No forecast data available for the selected country")
+
+
+def get_live_forecasts() -> pd.DataFrame | None:
+    """Fetch the forecast for every country, showing progress as they arrive.
+
+    Only the countries fetched within `FORECAST_DEADLINE_SECONDS` are returned, the others are
+    fetched in the background and are ready on a later rerun.
+    """
+    sites = get_sites()
+
+    # run forecast for all countries concurrently
+    my_bar = st.progress(0)
+
+    def show_progress(done: int, country: str) -> None:
+        my_bar.progress(
+            int((done - 1) / len(sites) * 100),
+            f"Loaded Solar forecast for {country} ({done}/{len(sites)})",
+        )
+
+    forecasts = get_country_forecasts(
+        sites,
+        progress=show_progress,
+        deadline_seconds=live_deadline_seconds or None,
     )
 
-    fig.update_layout(
-        mapbox_style="carto-positron",
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-        geo_scope="world",
+    my_bar.progress(100, "Loaded all forecasts.")
+    my_bar.empty()
+
+    return forecasts
+
+
+def show_missing_countries(forecasts: pd.DataFrame, capacities: CapacityTable) -> None:
+    """Show which countries are missing from the forecasts, and how much capacity they have."""
+    sites = get_sites()
+    missing = sorted(set(sites) - set(forecasts["country_code"]))
+    if not missing:
+        return
+
+    missing_gw = [capacities.capacity_per_country.get(code, 0.0) for code in missing]
+    share = sum(missing_gw) / capacities.global_capacity_gw * 100
+    st.warning(
+        f"Forecasts for {len(missing)} countries, with {share:.1f}% of global solar capacity, "
+        "have not arrived yet. They are left out of the totals and are blank on the map.",
     )
+    with st.expander("Missing countries"):
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "country": [sites[code][0] for code in missing],
+                    "capacity_gw": missing_gw,
+                },
+                index=pd.Index(missing, name="country_code"),
+            ).sort_values("capacity_gw", ascending=False),
+        )
+    # they are still being fetched in the background, so a rerun picks up the ones that are done
+    st.button("Fill in missing countries")
 
-    clicked_data = st.plotly_chart(fig, on_select="rerun", key="world_map")
 
-    if clicked_data and clicked_data["selection"]["points"]:
-        selected_point = clicked_data["selection"]["points"][0]
-        clicked_country_index = selected_point["location"]
+@st.cache_resource
+def start_snapshot_scheduler() -> None:
+    """Start building forecast snapshots in the background, once per process.
 
-        if clicked_country_index < len(world):
-            clicked_country_code = world.iloc[clicked_country_index]["adm0_a3"]
+    Set FORECAST_SCHEDULER=0 to disable this, e.g. when snapshots are built by a separate worker.
+    """
+    if os.getenv("FORECAST_SCHEDULER", "1") != "0":
+        start_scheduler()
 
-            if clicked_country_code in solar_capacity_per_country:
-                st.session_state.selected_country_code = clicked_country_code
-                st.switch_page(country_page_ref)
-            else:
-                st.warning("No forecast data available for the selected country")
+
+@st.cache_resource
+def start_metrics_endpoint() -> None:
+    """Serve the metrics in the background, once per process. Set METRICS_PORT=0 to disable."""
+    if metrics_port != 0:
+        start_metrics_server()
 
 
 def get_image_base64(image_path: str) -> str:
@@ -362,15 +364,7 @@ def capacities_page() -> None:
     """Solar capacities page."""
     st.header("Solar Capacities")
     st.write("This page shows the solar capacities per country.")
-    solar_capacity_per_country_df = pd.read_csv(
-        f"{data_dir}/solar_capacities.csv",
-        index_col=0,
-    )
-    solar_capacity_per_country_df["temp"] = solar_capacity_per_country_df.index
-    solar_capacity_per_country_df.dropna(subset=["temp"], inplace=True)
-    solar_capacity_per_country_df.drop(columns=["temp"], inplace=True)
-
-    st.dataframe(solar_capacity_per_country_df)
+    st.dataframe(load_capacity_table().table)
 
 
 if __name__ == "__main__":
@@ -389,6 +383,10 @@ if __name__ == "__main__":
         unsafe_allow_html=True,
     )
 
+    configure_logging()
+    start_metrics_endpoint()
+    start_snapshot_scheduler()
+
     country_page_ref = st.Page(country_page, title="Country")
 
     pg = st.navigation(
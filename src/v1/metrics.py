@@ -0,0 +1,118 @@
+"""Timings and counts of where the app spends its time, as Prometheus metrics and log lines.
+
+Each stage of the pipeline is timed with `timed`, which records a histogram of its duration
+and logs a structured line with loguru, with the stage and duration in the record's extra
+fields. Requests to the forecast API are counted and timed by their status, so slow pages
+can be told apart from a slow or failing API.
+
+The metrics are kept in prometheus_client's default registry, along with its process metrics,
+and served in the Prometheus text format at `/metrics` on METRICS_PORT, on the local interface
+only. The app and the snapshot worker start this server, set METRICS_PORT=0 to turn it off.
+The forecast HTTP API serves them at `/metrics` too.
+
+Set LOG_JSON=1 to log every line as JSON, with its extra fields.
+"""
+
+import functools
+import os
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIServer
+
+from loguru import logger
+from prometheus_client import Counter, Histogram, start_http_server
+
+metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_port = int(os.getenv("METRICS_PORT", "9464"))
+
+log_json = os.getenv("LOG_JSON", "0") == "1"
+
+# seconds, from in memory lookups to slow API requests
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+stage_seconds = Histogram(
+    "solar_forecast_stage_seconds",
+    "Time taken by each stage of the pipeline",
+    ["stage"],
+    buckets=default_buckets,
+)
+stage_errors_total = Counter(
+    "solar_forecast_stage_errors_total",
+    "Stages that raised an exception",
+    ["stage"],
+)
+upstream_request_seconds = Histogram(
+    "solar_forecast_upstream_request_seconds",
+    "Time taken by each request to the forecast API, including failed attempts",
+    ["endpoint", "status"],
+    buckets=default_buckets,
+)
+upstream_requests_total = Counter(
+    "solar_forecast_upstream_requests_total",
+    "Requests to the forecast API, by status code or exception",
+    ["endpoint", "status"],
+)
+
+
+@contextmanager
+def timed(stage: str, **fields: object) -> Iterator[None]:
+    """Time a stage of the pipeline, recording it as a metric and a structured log line.
+
+    It can also decorate a function, to time each call. Exceptions count as failures, but
+    not Streamlit's reruns and stops, which are not exceptions.
+
+    Args:
+        stage: Name of the stage, the `stage` label of the metric
+        fields: Extra fields for the log line, e.g. the number of countries
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.labels(stage=stage).observe(seconds)
+        if failed:
+            stage_errors_total.labels(stage=stage).inc()
+        logger.bind(stage=stage, seconds=round(seconds, 6), failed=failed, **fields).debug(
+            f"{stage} took {seconds * 1000:.1f} ms",
+        )
+
+
+def record_upstream_request(endpoint: str, status: str, seconds: float) -> None:
+    """Record a request to the forecast API, by its status code or exception name."""
+    upstream_requests_total.labels(endpoint=endpoint, status=status).inc()
+    upstream_request_seconds.labels(endpoint=endpoint, status=status).observe(seconds)
+    logger.bind(endpoint=endpoint, status=status, seconds=round(seconds, 6)).debug(
+        f"Forecast API {endpoint} request {status} in {seconds * 1000:.1f} ms",
+    )
+
+
+@functools.cache
+def configure_logging() -> None:
+    """Log as JSON lines, with each record's extra fields, if LOG_JSON=1. Only once per process."""
+    if log_json:
+        logger.remove()
+        logger.add(sys.stderr, serialize=True)
+
+
+def start_metrics_server(
+    host: str = metrics_host,
+    port: int = metrics_port,
+) -> WSGIServer | None:
+    """Serve the metrics from a background thread, on a port (0 for any free one).
+
+    Returns the server, or None if the port is already in use.
+    """
+    try:
+        server, _ = start_http_server(port, addr=host)
+    except OSError as e:
+        logger.warning(f"Not serving metrics on {host}:{port}: {e}")
+        return None
+    logger.info(f"Serving metrics at http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,290 @@
+"""Opt-in profiling of single page runs, to see what a slow rerun spends its time on.
+
+A profiled run is sampled by a background thread, which records the page's call stack every
+few milliseconds, and its memory allocations are traced. Each run writes to PROFILE_DIR:
+    <page>-<time>.speedscope.json   a flame graph, open it at https://www.speedscope.app
+    <page>-<time>.txt               the hottest functions and the peak memory allocations
+
+Profile every page run by setting PROFILE_PAGES=1, or a single run by setting PROFILE_TOKEN
+and adding `?profile=<token>` to the page's url. Only the page's own thread is sampled, so
+time spent waiting on worker threads, e.g. fetching forecasts, shows as that wait. Tracing
+memory slows the run down, so compare profiled runs with each other rather than with the
+stage timings in `metrics.py`.
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from types import FrameType
+from typing import Any
+
+import pandas as pd
+import streamlit as st
+from loguru import logger
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+data_dir = "src/v1/data"
+
+# where profiles are written, unless PROFILE_DIR is set
+default_profile_dir = f"{data_dir}/profiles"
+
+# profile every page run, rather than only when asked with the query parameter
+profile_pages = os.getenv("PROFILE_PAGES", "0") == "1"
+
+# secret for `?profile=<token>`, profiling from the url is off if this is not set
+profile_token = os.getenv("PROFILE_TOKEN", "")
+
+profile_interval_seconds = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+
+# how many functions and allocation sites to list in the summary
+summary_rows = 25
+
+# memory is traced while any profiled run is in progress, see `start_tracing` and `stop_tracing`
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_started_tracing = False
+
+# a frame of a sampled stack, as (function, file, line the function starts on)
+Frame = tuple[str, str, int]
+
+
+class SamplingProfiler:
+    """Samples the call stack of a thread at a regular interval, from a background thread."""
+
+    def __init__(self, thread_id: int, interval_seconds: float = profile_interval_seconds) -> None:
+        """Create a profiler for a thread, see `threading.get_ident`."""
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        # number of samples of each stack, from the outermost frame to the innermost
+        self.samples: Counter[tuple[Frame, ...]] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling, and wait for the last sample."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[stack_of(frame)] += 1
+
+
+def stack_of(frame: FrameType | None) -> tuple[Frame, ...]:
+    """The call stack of a frame, from the outermost frame to it."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def to_speedscope(
+    name: str,
+    samples: Counter[tuple[Frame, ...]],
+    interval_seconds: float,
+) -> dict[str, Any]:
+    """Convert sampled stacks to the speedscope format, with a weight in ms for each stack."""
+    frame_index: dict[Frame, int] = {}
+    stacks = []
+    weights = []
+    for stack, count in samples.items():
+        stacks.append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+        weights.append(count * interval_seconds * 1000)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "global-solar-forecast",
+        "shared": {
+            "frames": [
+                {"name": function, "file": file, "line": line}
+                for function, file, line in frame_index
+            ],
+        },
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            },
+        ],
+    }
+
+
+def hot_functions(samples: Counter[tuple[Frame, ...]], n: int = summary_rows) -> pd.DataFrame:
+    """The functions the most samples were in, by samples in the function itself and in total.
+
+    Returns a dataframe with `self` and `total` sample counts, and their fraction of all
+    samples, indexed by `function (file:line)`, sorted by `self`.
+    """
+    own: Counter[Frame] = Counter()
+    total: Counter[Frame] = Counter()
+    for stack, count in samples.items():
+        own[stack[-1]] += count
+        # count recursive functions once per sample
+        for frame in set(stack):
+            total[frame] += count
+
+    n_samples = sum(samples.values()) or 1
+    rows = []
+    for frame, count in total.items():
+        function, file, line = frame
+        rows.append(
+            {
+                "function": f"{function} ({file}:{line})",
+                "self": own[frame],
+                "self_percentage": own[frame] / n_samples * 100,
+                "total": count,
+                "total_percentage": count / n_samples * 100,
+            },
+        )
+    columns = ["function", "self", "self_percentage", "total", "total_percentage"]
+    hot = pd.DataFrame(rows, columns=columns).set_index("function")
+    return hot.sort_values(["self", "total"], ascending=False).head(n)
+
+
+@dataclass(frozen=True)
+class Profile:
+    """The result of a profiled run."""
+
+    speedscope_path: Path
+    summary_path: Path
+    seconds: float
+    peak_memory_mb: float
+
+
+def start_tracing() -> None:
+    """Start tracing memory allocations for a profiled run, see `stop_tracing`.
+
+    Runs in different sessions can be profiled at once, so tracing is started by the first of
+    them and stopped by the last, unless something else had already started it. The peak is
+    reset at the start of each run, so with runs at once it is the peak since the latest one
+    started.
+    """
+    global _tracing_runs, _started_tracing
+
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_runs += 1
+        tracemalloc.reset_peak()
+
+
+def stop_tracing() -> tuple[int, list[tracemalloc.Statistic]]:
+    """Stop tracing memory allocations for a profiled run.
+
+    Returns:
+        The peak memory allocated in bytes, and the largest allocations still held
+    """
+    global _tracing_runs, _started_tracing
+
+    with _tracing_lock:
+        _, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().statistics("lineno")[:summary_rows]
+        _tracing_runs -= 1
+        if _tracing_runs == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+    return peak, allocations
+
+
+@contextmanager
+def profile_run(name: str, output_dir: Path | None = None) -> Iterator[list[Profile]]:
+    """Profile the code run in this block, writing the profile when it finishes.
+
+    Profiles are written to `output_dir`, or else to PROFILE_DIR. Yields a list, which the
+    profile is added to once the block has finished.
+    """
+    if output_dir is None:
+        output_dir = Path(os.getenv("PROFILE_DIR", default_profile_dir))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profiles: list[Profile] = []
+    profiler = SamplingProfiler(threading.get_ident())
+
+    start_tracing()
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield profiles
+    finally:
+        profiler.stop()
+        seconds = time.perf_counter() - start
+        peak, allocations = stop_tracing()
+
+        stem = f"{name}-{pd.Timestamp.now(tz='UTC').strftime('%Y%m%dT%H%M%S%fZ')}"
+        speedscope_path = output_dir / f"{stem}.speedscope.json"
+        speedscope = to_speedscope(name, profiler.samples, profiler.interval_seconds)
+        speedscope_path.write_text(json.dumps(speedscope))
+
+        summary_path = output_dir / f"{stem}.txt"
+        summary = [
+            f"{name}: {seconds:.3f} s, {sum(profiler.samples.values())} samples "
+            f"every {profiler.interval_seconds * 1000:g} ms, "
+            f"peak memory allocated {peak / 1e6:.1f} MB",
+            "",
+            "Hottest functions, by samples in the function itself:",
+            hot_functions(profiler.samples).round(1).to_string(),
+            "",
+            "Largest allocations still held at the end of the run:",
+            *(str(statistic) for statistic in allocations),
+        ]
+        summary_path.write_text("\n".join(summary) + "\n")
+
+        profile = Profile(speedscope_path, summary_path, seconds, peak / 1e6)
+        profiles.append(profile)
+        logger.bind(page=name, seconds=round(seconds, 6), peak_memory_mb=peak / 1e6).info(
+            f"Profiled {name}, see {speedscope_path} and {summary_path}",
+        )
+
+
+def profiling_requested() -> bool:
+    """Whether to profile this page run, from PROFILE_PAGES or the `profile` query parameter.
+
+    The query parameter is removed, so only the run it was added for is profiled.
+    """
+    if profile_pages:
+        return True
+    if not profile_token or get_script_run_ctx(suppress_warning=True) is None:
+        return False
+    if st.query_params.get("profile") != profile_token:
+        return False
+    del st.query_params["profile"]
+    return True
+
+
+def profiled(page: Callable[[], None]) -> Callable[[], None]:
+    """Decorate a page to profile its runs when asked to, see `profiling_requested`."""
+
+    @functools.wraps(page)
+    def profiled_page() -> None:
+        if not profiling_requested():
+            page()
+            return
+
+        with profile_run(page.__name__) as profiles:
+            page()
+        st.caption(f"Profiled this run, see `{profiles[0].summary_path}`")
+
+    return profiled_page
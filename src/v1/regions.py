@@ -0,0 +1,156 @@
+"""Forecasts of regions and continents, each the sum of the forecasts of its countries.
+
+Which countries are in which region is saved once as a small csv, with a row per country in
+each region. For a forecast, it becomes a sparse `region x country` membership matrix, so the
+forecast of every region comes from a single matrix multiply with the `timestamp x country`
+forecast array, see `RegionMembership.rollup`.
+
+The continents come from the world geometries. Countries without geometries, such as very small
+states, are in the continent of the nearest country to their forecast location. Rebuild the csv
+after changing the geometries or the groups below, by running from the repo root:
+    python src/v1/regions.py
+"""
+
+import functools
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_array
+
+data_dir = "src/v1/data"
+
+membership_path = f"{data_dir}/region_membership.csv"
+
+continents = ["Africa", "Asia", "Europe", "North America", "South America", "Oceania"]
+
+eu_members = [
+    "AUT", "BEL", "BGR", "CYP", "CZE", "DEU", "DNK", "ESP", "EST", "FIN", "FRA", "GRC", "HRV",
+    "HUN", "IRL", "ITA", "LTU", "LUX", "LVA", "MLT", "NLD", "POL", "PRT", "ROU", "SVK", "SVN",
+    "SWE",
+]  # fmt: skip
+
+# groups of countries, by ISO alpha-3 code, as well as the continents
+country_groups = {
+    "ASEAN": [
+        "BRN", "IDN", "KHM", "LAO", "MMR", "MYS", "PHL", "SGP", "THA", "VNM",
+    ],
+    "EU": eu_members,
+    # the EU is a member of the G20 too
+    "G20": sorted(
+        {
+            "ARG", "AUS", "BRA", "CAN", "CHN", "DEU", "FRA", "GBR", "IDN", "IND", "ITA", "JPN",
+            "KOR", "MEX", "RUS", "SAU", "TUR", "USA", "ZAF",
+        }
+        | set(eu_members),
+    ),
+    "G7": ["CAN", "DEU", "FRA", "GBR", "ITA", "JPN", "USA"],
+    "Middle East": [
+        "ARE", "BHR", "IRN", "IRQ", "ISR", "JOR", "KWT", "LBN", "OMN", "PSE", "QAT", "SAU",
+        "SYR", "YEM",
+    ],
+    "OECD": [
+        "AUS", "AUT", "BEL", "CAN", "CHE", "CHL", "COL", "CRI", "CZE", "DEU", "DNK", "ESP",
+        "EST", "FIN", "FRA", "GBR", "GRC", "HUN", "IRL", "ISL", "ISR", "ITA", "JPN", "KOR",
+        "LTU", "LUX", "LVA", "MEX", "NLD", "NOR", "NZL", "POL", "PRT", "SVK", "SVN", "SWE",
+        "TUR", "USA",
+    ],
+}  # fmt: skip
+
+
+def build_region_membership() -> pd.DataFrame:
+    """Save the countries of every continent and group to `membership_path`."""
+    from registry import load_country_registry, load_world
+    from spatial import load_country_index
+
+    world = load_world()
+    registry = load_country_registry()
+
+    continent_of = world.drop_duplicates("adm0_a3").set_index("adm0_a3")["continent"]
+    continent = pd.Series(
+        continent_of.reindex(registry.index).to_numpy(),
+        index=registry.index,
+        dtype=object,
+    )
+
+    # countries without geometries are in the continent of the nearest country
+    unknown = registry[continent.isna()].dropna(subset=["lat", "lon"])
+    nearest, _ = load_country_index().nearest_countries(
+        unknown["lat"].to_numpy(),
+        unknown["lon"].to_numpy(),
+        max_distance_degrees=None,
+    )
+    continent[unknown.index] = continent_of.reindex(nearest).to_numpy()
+
+    rows = [
+        {"region": region, "country_code": country_code}
+        for region in continents
+        for country_code in continent.index[continent == region]
+    ]
+    for region, country_codes in country_groups.items():
+        missing = sorted(set(country_codes) - set(registry.index))
+        if missing:
+            logger.warning(f"{region} countries not in the registry: {missing}")
+        rows.extend({"region": region, "country_code": code} for code in country_codes)
+
+    membership = pd.DataFrame(rows)
+    membership.to_csv(membership_path, index=False)
+    return membership
+
+
+@functools.cache
+def load_region_table() -> pd.DataFrame:
+    """Load the countries of each region, a row per country in each region, once per process."""
+    return pd.read_csv(membership_path, keep_default_na=False)
+
+
+@dataclass(frozen=True)
+class RegionMembership:
+    """Which countries of a forecast are in each region, as a sparse matrix.
+
+    Attributes:
+        regions: The regions, in the order of the matrix rows
+        matrix: `region x country` matrix, 1 where the country is in the region
+    """
+
+    regions: pd.Index
+    matrix: "csr_array"
+
+    def rollup(self, power_gw: np.ndarray) -> np.ndarray:
+        """Sum `timestamp x country` forecasts into `timestamp x region` forecasts.
+
+        Countries without a forecast at a timestamp count as 0.
+        """
+        rollup: np.ndarray = (self.matrix @ np.nan_to_num(power_gw).T).T
+        return rollup
+
+
+def region_membership(country_codes: pd.Index) -> RegionMembership:
+    """Make the membership matrix of the regions, for the countries of a forecast.
+
+    Countries that are in no region are left out of every region, and regions without any of
+    the countries are kept, with a forecast of 0.
+    """
+    from scipy.sparse import csr_array
+
+    table = load_region_table()
+    regions = pd.Index(table["region"].unique())
+    columns = pd.Index(country_codes).get_indexer(table["country_code"])
+    known = columns >= 0
+
+    matrix = csr_array(
+        (
+            np.ones(known.sum()),
+            (regions.get_indexer(table["region"][known]), columns[known]),
+        ),
+        shape=(len(regions), len(country_codes)),
+    )
+    return RegionMembership(regions=regions, matrix=matrix)
+
+
+if __name__ == "__main__":
+    build_region_membership()
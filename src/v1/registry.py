@@ -0,0 +1,226 @@
+"""Registry of countries, with everything the pages need to know about each one.
+
+The registry holds the code, name, forecast location and timezone of every country, and which
+row of the world geometries it is. It is built once from the world geometries and pycountry, and
+saved as a small csv, so the pages don't do any geometry work and all use the same location for
+each country. The capacities are not in the registry, they are read from the capacities table,
+so that they are always the latest ones.
+
+Rebuild it after changing the geometries, by running from the repo root:
+    python src/v1/registry.py
+"""
+
+import functools
+import warnings
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from capacities import load_capacity_table
+from loguru import logger
+from metrics import timed
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    from shapely.geometry import Point
+    from shapely.geometry.base import BaseGeometry
+
+data_dir = "src/v1/data"
+
+registry_path = f"{data_dir}/country_registry.csv"
+
+# Manual coordinates for very small states not in the world geometries
+fallback_coords = {
+    "HKG": (22.3193, 114.1694),
+    "SGP": (1.3521, 103.8198),
+    "MAC": (22.1987, 113.5439),
+    "MDV": (3.2028, 73.2207),
+    "AND": (42.5462, 1.6016),
+    "LUX": (49.6117, 6.1319),
+    "MCO": (43.7384, 7.4246),
+    "SMR": (43.9336, 12.4508),
+    "VAT": (41.9029, 12.4534),
+    "NRU": (-0.5228, 166.9315),
+    "TUV": (-7.1095, 177.6493),
+    "KIR": (1.8709, 157.3630),
+    "PLW": (7.5149, 134.5825),
+    "WSM": (-13.7590, -172.1046),
+    # Newly added missing countries / territories
+    "ATG": (17.0608, -61.7964),  # Antigua and Barbuda
+    "BHS": (25.0343, -77.3963),  # Bahamas
+    "BRB": (13.1939, -59.5432),  # Barbados
+    "BLZ": (17.1899, -88.4976),  # Belize
+    "DMA": (15.4150, -61.3710),  # Dominica
+    "GRD": (12.1165, -61.6790),  # Grenada
+    "KNA": (17.3578, -62.7830),  # Saint Kitts and Nevis
+    "LCA": (13.9094, -60.9789),  # Saint Lucia
+    "VCT": (13.2528, -61.1971),  # Saint Vincent and the Grenadines
+    "SYC": (-4.6796, 55.4920),  # Seychelles
+    "COM": (-11.6455, 43.3333),  # Comoros
+    "STP": (0.1864, 6.6131),  # São Tomé and Príncipe
+    "TLS": (-8.8742, 125.7275),  # Timor-Leste
+    "FJI": (-17.7134, 178.0650),  # Fiji
+    "TON": (-21.1789, -175.1982),  # Tonga
+    "VUT": (-15.3767, 166.9592),  # Vanuatu
+    "SLB": (-9.6457, 160.1562),  # Solomon Islands
+    "MHL": (7.1315, 171.1845),  # Marshall Islands
+    "FSM": (6.8878, 158.2150),  # Micronesia
+    "CPV": (14.9177, -23.5090),  # Cabo Verde
+    "BRN": (4.5353, 114.7277),  # Brunei
+    "BHR": (26.0667, 50.5577),  # Bahrain
+    "DJI": (11.8251, 42.5903),  # Djibouti
+    "GNB": (11.8037, -15.1804),  # Guinea-Bissau
+    "SWZ": (-26.5225, 31.4659),  # Eswatini
+    "LSO": (-29.6099, 28.2336),  # Lesotho
+    "ATA": (-82.8628, 135.0000),  # Antarctica
+    "ATF": (-49.2800, 69.3500),  # French Southern and Antarctic Lands
+    "FLK": (-51.7963, -59.5236),  # Falkland Islands
+    "GRL": (71.7069, -42.6043),  # Greenland
+    "NCL": (-21.5511, 165.6180),  # New Caledonia
+    "COK": (-21.2367, -159.7777),  # Cook Islands
+    "NIU": (-19.0544, -169.8672),  # Niue
+    "PYF": (-17.6797, -149.4068),  # French Polynesia
+    "ASM": (-14.2706, -170.1322),  # American Samoa
+    "GUM": (13.4443, 144.7937),  # Guam
+    "TKL": (-9.2002, -171.8480),  # Tokelau
+    "MLT": (35.9375, 14.3754),  # Malta
+    "ESH": (24.2155, -12.8858),  # Western Sahara
+    "MUS": (-20.2759, 57.5704),  # Mauritius
+    "PSE": (31.9522, 35.2332),  # Palestine
+}
+
+
+def load_world() -> "gpd.GeoDataFrame":
+    """Load the world geometries, with an `adm0_a3` column of ISO alpha-3 country codes."""
+    import geopandas as gpd
+
+    world = gpd.read_file(f"{data_dir}/countries.geojson").to_crs(crs="EPSG:4326")
+    # Ensure we have a column with ISO A3 country codes
+    possible_cols = ["adm0_a3", "ADM0_A3", "iso_a3", "ISO_A3", "sov_a3", "gu_a3"]
+    iso_col = next((c for c in possible_cols if c in world.columns), None)
+    if iso_col is None:
+        raise KeyError(f"No ISO country code column found. Columns: {world.columns.tolist()}")
+    world = world.rename(columns={iso_col: "adm0_a3"})
+    # Fix known incorrect country codes
+    world["adm0_a3"] = world["adm0_a3"].replace({"SDS": "SSD"})
+
+    return world
+
+
+def location_in(geometry: "BaseGeometry") -> "Point":
+    """The centroid of a country, or of its largest part if that is not in the country.
+
+    The centroid of a country with far flung parts, such as the USA with Alaska, can be
+    outside it, or in another country.
+    """
+    centroid = geometry.centroid
+    if geometry.contains(centroid):
+        return centroid
+    largest: BaseGeometry = max(getattr(geometry, "geoms", [geometry]), key=lambda part: part.area)
+    centroid = largest.centroid
+    return centroid if largest.contains(centroid) else largest.representative_point()
+
+
+def build_country_registry() -> pd.DataFrame:
+    """Build the registry of every pycountry country, and save it to `registry_path`."""
+    import pycountry
+    from country import get_timezone
+    from spatial import validate_locations
+
+    world = load_world()
+
+    # a location in each country, computed in a projected crs
+    projected = world.to_crs("EPSG:3857").geometry
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore")
+        centroids = projected.apply(location_in).set_crs(projected.crs).to_crs("EPSG:4326")
+
+    rows = []
+    for country in pycountry.countries:
+        geometry_rows = world.index[world["adm0_a3"] == country.alpha_3]
+        if len(geometry_rows) > 0:
+            geometry_row = int(geometry_rows[0])
+            lat, lon = centroids[geometry_row].y, centroids[geometry_row].x
+        else:
+            geometry_row = -1
+            lat, lon = fallback_coords.get(country.alpha_3, (float("nan"), float("nan")))
+
+        rows.append(
+            {
+                "country_code": country.alpha_3,
+                "country_name": country.name,
+                "lat": round(lat, 4),
+                "lon": round(lon, 4),
+                "timezone": get_timezone(country.alpha_2),
+                "geometry_row": geometry_row,
+            },
+        )
+
+    registry = pd.DataFrame(rows).set_index("country_code").sort_index()
+    registry.to_csv(registry_path)
+
+    checked = validate_locations(registry)
+    for country_code, row in checked[checked["valid"] == False].iterrows():  # noqa: E712
+        logger.warning(
+            f"Location of {country_code} is {row['distance_degrees']:.2f} degrees outside it, "
+            f"in {row['located']}",
+        )
+
+    return registry
+
+
+@functools.cache
+def load_country_registry() -> pd.DataFrame:
+    """Load the country registry, indexed by country code. It is only read once per process."""
+    with timed("registry_load"):
+        return pd.read_csv(registry_path, index_col="country_code")
+
+
+def get_location(country_code: str) -> tuple[float, float] | None:
+    """Get the `(lat, lon)` forecast location of a country, or None if it doesn't have one."""
+    registry = load_country_registry()
+    if country_code not in registry.index:
+        return None
+    lat, lon = registry.loc[country_code, ["lat", "lon"]].to_numpy(dtype=float)
+    if np.isnan(lat):
+        return None
+    return float(lat), float(lon)
+
+
+def get_sites() -> dict[str, tuple[str, float, float, float]]:
+    """Get the forecast site of every country with a capacity and a location.
+
+    The capacities are the latest ones from the capacities table. Countries with a capacity but
+    no location are left out, and logged once.
+
+    Returns:
+        Mapping of country code to `(name, capacity, lat, lon)`
+    """
+    registry = load_country_registry()
+    capacity_per_country = load_capacity_table().capacity_per_country
+
+    sites: dict[str, tuple[str, float, float, float]] = {}
+    unlocated = []
+    for country_code, capacity in capacity_per_country.items():
+        if not capacity > 0:
+            continue
+        location = get_location(country_code)
+        if location is None:
+            unlocated.append(country_code)
+            continue
+        name = str(registry.at[country_code, "country_name"])
+        sites[country_code] = (name, float(capacity), *location)
+
+    if unlocated:
+        warn_unlocated(tuple(sorted(unlocated)))
+    return dict(sorted(sites.items()))
+
+
+@functools.cache
+def warn_unlocated(country_codes: tuple[str, ...]) -> None:
+    """Log the countries with a capacity but no location, once per process."""
+    logger.warning(f"No forecast location for {', '.join(country_codes)}, leaving them out")
+
+
+if __name__ == "__main__":
+    build_country_registry()
@@ -0,0 +1,209 @@
+"""Global forecast snapshots, built in the background so pages never wait on the API.
+
+A snapshot is the forecast for every country in the capacities table, for one forecast hour.
+Each snapshot is written to its own versioned directory, and the `LATEST` file points at the
+most recent complete one. Both are swapped in with atomic renames, so readers never see a
+partially written snapshot.
+
+The global total and the top countries, which every view of the global page shows, are
+computed once when the snapshot is built and written with it.
+
+Run from the repo root:
+    python src/v1/snapshot.py warm   # build a snapshot now, e.g. at deploy time
+    python src/v1/snapshot.py run    # keep building a snapshot shortly after every hour
+"""
+
+import argparse
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+from cache import current_forecast_hour
+from cube import ForecastCube, GlobalAggregates, aggregate_forecasts, build_forecast_cube
+from forecast import get_country_forecasts
+from loguru import logger
+from metrics import configure_logging, metrics_port, start_metrics_server, timed
+from registry import get_sites
+
+data_dir = "src/v1/data"
+
+snapshot_dir = Path(os.getenv("FORECAST_SNAPSHOT_DIR", f"{data_dir}/snapshots"))
+
+# how many minutes after the hour to build the new snapshot
+snapshot_offset_minutes = int(os.getenv("FORECAST_SNAPSHOT_OFFSET_MINUTES", "5"))
+
+# how many old snapshots to keep on disk
+snapshots_to_keep = 3
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """A global forecast snapshot."""
+
+    version: str
+    forecast_hour: str
+    created_at: str
+    forecasts: pd.DataFrame
+    aggregates: GlobalAggregates = field(repr=False)
+
+    @functools.cached_property
+    def cube(self) -> ForecastCube:
+        """The forecasts as arrays, built once per snapshot."""
+        return build_forecast_cube(self.forecasts)
+
+
+@timed("snapshot_build")
+def build_snapshot(fresh: bool = True) -> Snapshot:
+    """Fetch forecasts for every country and write them as the latest snapshot.
+
+    Args:
+        fresh: Always fetch new forecasts, rather than serving them from the cache
+    """
+    forecast_hour = current_forecast_hour()
+    sites = get_sites()
+    logger.info(f"Building forecast snapshot for {forecast_hour} with {len(sites)} countries")
+
+    forecasts = get_country_forecasts(sites, fresh=fresh)
+    if forecasts is None:
+        raise RuntimeError("No forecasts could be fetched, not writing a snapshot")
+
+    missing = sorted(set(sites) - set(forecasts["country_code"]))
+    if missing:
+        logger.warning(f"Snapshot is missing forecasts for {', '.join(missing)}")
+
+    created_at = pd.Timestamp.now(tz="UTC")
+    snapshot = Snapshot(
+        version=created_at.strftime("%Y%m%dT%H%M%SZ"),
+        forecast_hour=forecast_hour,
+        created_at=created_at.isoformat(),
+        forecasts=forecasts,
+        aggregates=aggregate_forecasts(build_forecast_cube(forecasts)),
+    )
+    write_snapshot(snapshot, missing)
+    logger.info(f"Wrote forecast snapshot {snapshot.version}")
+
+    return snapshot
+
+
+def write_snapshot(snapshot: Snapshot, missing: list[str]) -> None:
+    """Atomically write a snapshot and make it the latest one."""
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+    tmp_dir = snapshot_dir / f".tmp-{snapshot.version}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+    snapshot.forecasts.to_parquet(tmp_dir / "forecasts.parquet", index=False)
+    snapshot.aggregates.total.to_parquet(tmp_dir / "global.parquet")
+    snapshot.aggregates.top_countries.to_parquet(tmp_dir / "top_countries.parquet")
+    snapshot.aggregates.regions.to_parquet(tmp_dir / "regions.parquet")
+    meta = {
+        "version": snapshot.version,
+        "forecast_hour": snapshot.forecast_hour,
+        "created_at": snapshot.created_at,
+        "missing_country_codes": missing,
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+    tmp_dir.rename(snapshot_dir / snapshot.version)
+
+    tmp_latest = snapshot_dir / ".tmp-LATEST"
+    tmp_latest.write_text(snapshot.version)
+    os.replace(tmp_latest, snapshot_dir / "LATEST")
+
+    # remove old snapshots
+    versions = sorted(p for p in snapshot_dir.iterdir() if p.is_dir() and p.name[0] != ".")
+    for old in versions[:-snapshots_to_keep]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def latest_snapshot_version() -> str | None:
+    """Get the version of the latest snapshot, or None if there is no snapshot yet."""
+    try:
+        return (snapshot_dir / "LATEST").read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+@functools.lru_cache(maxsize=2)
+def load_snapshot(version: str) -> Snapshot:
+    """Load a snapshot by version. Snapshots never change, so they are cached."""
+    version_dir = snapshot_dir / version
+    meta = json.loads((version_dir / "meta.json").read_text())
+
+    return Snapshot(
+        version=meta["version"],
+        forecast_hour=meta["forecast_hour"],
+        created_at=meta["created_at"],
+        forecasts=pd.read_parquet(version_dir / "forecasts.parquet"),
+        aggregates=GlobalAggregates(
+            total=pd.read_parquet(version_dir / "global.parquet"),
+            top_countries=pd.read_parquet(version_dir / "top_countries.parquet"),
+            regions=pd.read_parquet(version_dir / "regions.parquet"),
+        ),
+    )
+
+
+def load_latest_snapshot() -> Snapshot | None:
+    """Load the latest snapshot, or None if there is no snapshot yet."""
+    version = latest_snapshot_version()
+    if version is None:
+        return None
+    return load_snapshot(version)
+
+
+def seconds_until_next_run() -> float:
+    """Seconds until the next snapshot should be built, a few minutes after the next hour."""
+    now = pd.Timestamp.now(tz="UTC")
+    next_run = now.floor("h") + pd.Timedelta(minutes=snapshot_offset_minutes)
+    if next_run <= now:
+        next_run += pd.Timedelta(hours=1)
+    return (next_run - now).total_seconds()
+
+
+def run_scheduler() -> None:
+    """Build a snapshot now if the latest one is out of date, and then after every hour."""
+    while True:
+        snapshot = load_latest_snapshot()
+        if snapshot is None or snapshot.forecast_hour != current_forecast_hour():
+            try:
+                # without any snapshot the pages fetch the forecasts themselves, so go through
+                # the cache and share their requests rather than sending every one twice
+                build_snapshot(fresh=snapshot is not None)
+            except Exception:
+                logger.exception("Failed to build forecast snapshot")
+        time.sleep(seconds_until_next_run())
+
+
+def start_scheduler() -> threading.Thread:
+    """Start the snapshot scheduler in a background thread."""
+    thread = threading.Thread(target=run_scheduler, name="forecast-snapshot", daemon=True)
+    thread.start()
+    return thread
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Build global forecast snapshots.")
+    parser.add_argument(
+        "command",
+        choices=["warm", "run"],
+        help="'warm' builds a snapshot now, 'run' builds one after every hour",
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.command == "warm":
+        build_snapshot()
+    else:
+        if metrics_port != 0:
+            start_metrics_server()
+        run_scheduler()
+
+
+if __name__ == "__main__":
+    main()
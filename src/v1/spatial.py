@@ -0,0 +1,224 @@
+"""Which country a location is in, for many locations at once.
+
+The country polygons are indexed in an STRtree, so each lookup only tests the few polygons
+whose bounding boxes contain the point, rather than every country. The polygons are saved once
+from `countries.geojson` as well known binary in a parquet file, which loads much faster than
+the geojson and doesn't need geopandas.
+
+Run from the repo root:
+    python src/v1/spatial.py build                  # save the polygons, after changing them
+    python src/v1/spatial.py validate               # check the registry's forecast locations
+    python src/v1/spatial.py locate in.csv out.csv  # add a country_code to `lat`, `lon` rows
+"""
+
+import argparse
+import functools
+from dataclasses import dataclass
+from typing import cast
+
+import numpy as np
+import pandas as pd
+import shapely
+from loguru import logger
+from metrics import timed
+
+data_dir = "src/v1/data"
+
+shapes_path = f"{data_dir}/country_shapes.parquet"
+
+# how far from a country, in degrees, a location can still be matched to it, e.g. for
+# coastal sites just outside a simplified coastline
+default_max_distance_degrees = 0.5
+
+
+def build_country_shapes() -> pd.DataFrame:
+    """Save the polygons of each country from the world geometries to `shapes_path`."""
+    from registry import load_world
+
+    world = load_world()
+    shapes = world.groupby("adm0_a3")["geometry"].agg(shapely.union_all)
+    shapes_df = pd.DataFrame(
+        {"country_code": shapes.index, "geometry": shapely.to_wkb(shapes.to_numpy())},
+    )
+    shapes_df.to_parquet(shapes_path, index=False)
+    return shapes_df
+
+
+def make_points(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Make an array of shapely points from arrays of latitudes and longitudes."""
+    points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    # shapely's stubs can't tell that arrays of coordinates make an array of points
+    return cast("np.ndarray", points)
+
+
+@dataclass(frozen=True)
+class CountryIndex:
+    """The country polygons, indexed for point in country and nearest country queries.
+
+    Lookups take arrays of latitudes and longitudes, and return an array of country codes,
+    with None where there is no country.
+    """
+
+    country_codes: np.ndarray
+    geometries: np.ndarray
+    tree: shapely.STRtree
+
+    def countries_at(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """The country each location is in."""
+        points = make_points(lats, lons)
+        point_index, country_index = self.tree.query(points, predicate="intersects")
+
+        # on a border, the first country in the index wins
+        order = np.lexsort((country_index, point_index))
+        located, first = np.unique(point_index[order], return_index=True)
+
+        countries = np.empty(len(points), dtype=object)
+        countries[located] = self.country_codes[country_index[order][first]]
+        return countries
+
+    def nearest_countries(
+        self,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        max_distance_degrees: float | None = default_max_distance_degrees,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """The country nearest to each location, and the distance to it in degrees.
+
+        Locations in a country are 0 from it. Locations further than `max_distance_degrees`
+        from every country have no country, and an infinite distance.
+        """
+        points = make_points(lats, lons)
+        (point_index, country_index), distances = self.tree.query_nearest(
+            points,
+            max_distance=max_distance_degrees,
+            return_distance=True,
+            all_matches=False,
+        )
+
+        countries = np.empty(len(points), dtype=object)
+        countries[point_index] = self.country_codes[country_index]
+        nearest_distances = np.full(len(points), np.inf)
+        nearest_distances[point_index] = distances
+        return countries, nearest_distances
+
+    def locate(
+        self,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        max_distance_degrees: float = default_max_distance_degrees,
+    ) -> np.ndarray:
+        """The country each location is in, or else the nearest one within a distance."""
+        countries = self.countries_at(lats, lons)
+        outside = np.flatnonzero(pd.isna(countries))
+        if len(outside) > 0:
+            nearest, _ = self.nearest_countries(
+                np.asarray(lats)[outside],
+                np.asarray(lons)[outside],
+                max_distance_degrees,
+            )
+            countries[outside] = nearest
+        return countries
+
+    def distances_to(
+        self,
+        country_codes: np.ndarray,
+        lats: np.ndarray,
+        lons: np.ndarray,
+    ) -> np.ndarray:
+        """The distance of each location from a country in degrees, NaN for unknown countries."""
+        points = make_points(lats, lons)
+        positions = pd.Index(self.country_codes).get_indexer(country_codes)
+        known = positions >= 0
+
+        distances = np.full(len(points), np.nan)
+        distances[known] = shapely.distance(points[known], self.geometries[positions[known]])
+        return distances
+
+
+@functools.cache
+def load_country_index() -> CountryIndex:
+    """Load the country polygons and index them, once per process."""
+    with timed("country_index_load"):
+        shapes = pd.read_parquet(shapes_path)
+        geometries = shapely.from_wkb(shapes["geometry"].to_numpy())
+        shapely.prepare(geometries)
+        return CountryIndex(
+            country_codes=shapes["country_code"].to_numpy(dtype=object),
+            geometries=geometries,
+            tree=shapely.STRtree(geometries),
+        )
+
+
+def validate_locations(
+    locations: pd.DataFrame,
+    max_distance_degrees: float = default_max_distance_degrees,
+) -> pd.DataFrame:
+    """Check that forecast locations are in, or close to, their own countries.
+
+    Args:
+        locations: Indexed by country code, with `lat` and `lon` columns
+        max_distance_degrees: How far outside its country a location can be
+
+    Returns:
+        The locations with the country they are in or nearest to, their distance in degrees
+        from their own country, and whether that is within `max_distance_degrees`. Countries
+        without polygons, such as very small states, can't be checked and are left as NaN.
+    """
+    index = load_country_index()
+    locations = locations.dropna(subset=["lat", "lon"])
+    lats, lons = locations["lat"].to_numpy(), locations["lon"].to_numpy()
+
+    distances = index.distances_to(locations.index.to_numpy(), lats, lons)
+    checked = locations[["lat", "lon"]].assign(
+        located=index.locate(lats, lons, max_distance_degrees),
+        distance_degrees=distances,
+        valid=pd.Series(distances <= max_distance_degrees, index=locations.index).where(
+            ~np.isnan(distances),
+        ),
+    )
+    return checked
+
+
+def locate_file(input_path: str, output_path: str, max_distance_degrees: float) -> None:
+    """Add the country code of each `lat`, `lon` row of a csv file."""
+    sites = pd.read_csv(input_path)
+    sites["country_code"] = load_country_index().locate(
+        sites["lat"].to_numpy(),
+        sites["lon"].to_numpy(),
+        max_distance_degrees,
+    )
+    sites.to_csv(output_path, index=False)
+    logger.info(f"Located {sites['country_code'].notna().sum()} of {len(sites)} sites")
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Find the country of locations.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Save the country polygons")
+    subparsers.add_parser("validate", help="Check the registry's forecast locations")
+    locate_parser = subparsers.add_parser("locate", help="Add country codes to a csv of sites")
+    locate_parser.add_argument("input")
+    locate_parser.add_argument("output")
+    locate_parser.add_argument(
+        "--max-distance",
+        type=float,
+        default=default_max_distance_degrees,
+        help="Furthest a site can be from its country, in degrees",
+    )
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_country_shapes()
+    elif args.command == "validate":
+        from registry import load_country_registry
+
+        checked = validate_locations(load_country_registry())
+        invalid = checked[checked["valid"] == False]  # noqa: E712
+        print(invalid.to_string() if len(invalid) > 0 else "All locations are valid")  # noqa: T201
+    else:
+        locate_file(args.input, args.output, args.max_distance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""The world forecast map, with its static parts built once per process.
+
+The geometries, locations, hover text and layout of the map never change between reruns, only
+the values shown on it do. The base figure is built and validated once for each level of
+detail, and each rerun swaps in just the values and the colorbar title.
+
+The map can also be animated, with a frame of values for each forecast time. The frames only
+hold values and share the base figure's geometries, and are played in the browser.
+"""
+
+import functools
+from collections.abc import Sequence
+from typing import Any
+
+import numpy as np
+import plotly.graph_objects as go
+from geometry import load_world_geojson
+from metrics import timed
+
+
+# st.plotly_chart only takes a plotly figure, or a dict that it validates again, so this has to
+# be a figure, but plotly has no type hints
+class PrebuiltFigure(go.Figure):  # type: ignore[misc]
+    """A figure from an already validated figure dict.
+
+    Streamlit turns figures into dicts with `to_dict`, which deep copies and re-validates
+    every property, including the geometries. This figure returns its dict as it is.
+    """
+
+    def __init__(self, figure_dict: dict[str, Any]) -> None:
+        """Wrap an already validated figure dict."""
+        super().__init__()
+        self._figure_dict = figure_dict
+
+    def to_dict(self) -> dict[str, Any]:
+        """The figure as a dict, without copying or validating it again."""
+        return self._figure_dict
+
+
+@functools.cache
+def get_base_map_figure(detail_level: str) -> dict[str, Any]:
+    """Build the static parts of the map for a level of detail, once per process.
+
+    The returned dict is shared, so it must not be modified.
+    """
+    shapes_dict = load_world_geojson(detail_level)
+    country_codes = [feature["id"] for feature in shapes_dict["features"]]
+
+    with timed("map_base_build", detail_level=detail_level):
+        fig = go.Figure(
+            data=go.Choroplethmap(
+                geojson=shapes_dict,
+                locations=country_codes,
+                colorscale="Viridis",
+                marker_opacity=0.5,
+                hovertemplate="<b>%{customdata}</b><br>Power: %{z:.2f} GW<extra></extra>",
+                customdata=country_codes,
+            ),
+        )
+
+        fig.update_layout(
+            mapbox_style="carto-positron",
+            margin={"r": 0, "t": 0, "l": 0, "b": 0},
+            geo_scope="world",
+        )
+
+        figure_dict: dict[str, Any] = fig.to_dict()
+        return figure_dict
+
+
+def get_map_country_codes(detail_level: str) -> list[str]:
+    """The country codes on the map, in the order of its values."""
+    country_codes: list[str] = get_base_map_figure(detail_level)["data"][0]["locations"]
+    return country_codes
+
+
+def make_map_figure(
+    detail_level: str,
+    z: Sequence[float] | np.ndarray,
+    colorbar_title: str,
+) -> go.Figure:
+    """Make the map with values for each of its countries, reusing the static base figure."""
+    base = get_base_map_figure(detail_level)
+    trace = {**base["data"][0], "z": z, "colorbar": {"title": {"text": colorbar_title}}}
+    return PrebuiltFigure({**base, "data": [trace]})
+
+
+def make_animated_map_figure(
+    detail_level: str,
+    frame_labels: Sequence[str],
+    frame_z: np.ndarray,
+    colorbar_title: str,
+) -> go.Figure:
+    """Make the map with a frame for each forecast time, to play and scrub in the browser.
+
+    Args:
+        detail_level: Level of detail of the map's geometries
+        frame_labels: Label of each frame, shown on the slider
+        frame_z: Values for the map's countries, with a row for each frame
+        colorbar_title: Title of the colorbar
+    """
+    base = get_base_map_figure(detail_level)
+    # keep the same colours for the same values in every frame
+    zmax = float(np.nanmax(frame_z)) if np.isfinite(frame_z).any() else 1.0
+    trace = {
+        **base["data"][0],
+        "z": frame_z[0],
+        "zmin": 0.0,
+        "zmax": zmax,
+        "colorbar": {"title": {"text": colorbar_title}},
+    }
+    frames = [
+        {"name": label, "data": [{"type": "choroplethmap", "z": z}], "traces": [0]}
+        for label, z in zip(frame_labels, frame_z, strict=True)
+    ]
+
+    # plotly.js plays every frame for None, and stops playing for [None]
+    def animate(frame_names: Sequence[str | None] | None, duration: int) -> dict[str, Any]:
+        return {
+            "method": "animate",
+            "args": [
+                frame_names,
+                {
+                    "frame": {"duration": duration, "redraw": True},
+                    "transition": {"duration": 0},
+                    "mode": "immediate",
+                    "fromcurrent": True,
+                },
+            ],
+        }
+
+    layout = {
+        **base["layout"],
+        "margin": {"r": 0, "t": 0, "l": 0, "b": 80},
+        "updatemenus": [
+            {
+                "type": "buttons",
+                "direction": "left",
+                "x": 0,
+                "y": 0,
+                "xanchor": "left",
+                "yanchor": "top",
+                "pad": {"t": 40},
+                "buttons": [
+                    {"label": "Play", **animate(None, 300)},
+                    {"label": "Pause", **animate([None], 0)},
+                ],
+            },
+        ],
+        "sliders": [
+            {
+                "x": 0.15,
+                "y": 0,
+                "len": 0.85,
+                "yanchor": "top",
+                "currentvalue": {"prefix": "Time (UTC): "},
+                "steps": [{"label": label, **animate([label], 0)} for label in frame_labels],
+            },
+        ],
+    }
+    return PrebuiltFigure({**base, "data": [trace], "layout": layout, "frames": frames})
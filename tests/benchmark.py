@@ -0,0 +1,236 @@
+"""Benchmarks of the forecast pipeline, against a local stand-in for the forecast API.
+
+The functions the main page and the country page call are timed for a few numbers of sites,
+reporting the wall time of each, and of the stages they time themselves with `metrics.timed`,
+such as fetching and smoothing. The API is `tests.quartz_stub`, which can be made slow and
+unreliable, or replay a recorded response.
+
+Run from the repo root:
+    python -m tests.benchmark
+    python -m tests.benchmark --sites 50 200 --latency 0.1 --jitter 0.1 --error-rate 0.02
+    python -m tests.benchmark --memory --json before.json
+
+With `--memory`, the peak memory allocated during each stage is measured with tracemalloc too.
+It slows the stages down a lot, the threaded fetch most of all, so compare timings from runs
+with the same settings.
+"""
+
+import argparse
+import functools
+import importlib
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+sys.path.insert(0, "src/v1")
+
+import numpy as np
+import pandas as pd
+import plotly.io
+import plotly.tools
+from cache import ForecastCache
+from client import ForecastClient
+from cube import aggregate_forecasts, build_forecast_cube
+from forecast import get_country_forecasts, get_forecast, get_forecasts, smooth_predictions
+from geometry import default_detail_level
+from loguru import logger
+from regions import load_region_table
+from world_map import get_map_country_codes, make_animated_map_figure, make_map_figure
+
+from tests.quartz_stub import QuartzStub
+
+# number of countries to look at on the country page
+country_page_runs = 10
+
+
+def make_sites(n: int, seed: int = 0) -> dict[str, tuple[str, float, float, float]]:
+    """Make some sites spread over the world, in the format of `registry.get_sites`."""
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-50, 65, n).round(4)
+    lons = rng.uniform(-180, 180, n).round(4)
+    capacities = rng.lognormal(0, 1.5, n).round(4)
+    return {
+        f"S{i:04d}": (f"Site {i}", float(capacity), float(lat), float(lon))
+        for i, (capacity, lat, lon) in enumerate(zip(capacities, lats, lons, strict=True))
+    }
+
+
+def to_streamlit_json(figure: Any) -> str:
+    """Serialise a figure the way `st.plotly_chart` does."""
+    figure_dict = plotly.tools.return_figure_from_figure_or_data(figure, validate_figure=True)
+    figure_json: str = plotly.io.to_json(figure_dict, validate=False)
+    return figure_json
+
+
+class Stages:
+    """Times stages, and optionally records the peak memory each one allocates.
+
+    The stages the app times itself within each one, see `metrics.timed`, are reported too.
+    """
+
+    def __init__(self, trace_memory: bool) -> None:
+        """Start with no stages."""
+        self.trace_memory = trace_memory
+        self.results: list[dict[str, Any]] = []
+
+    def run(self, name: str, function: Callable[[], Any]) -> Any:
+        """Run a stage, returning its result."""
+        inner_seconds: dict[str, float] = {}
+
+        def record_inner(message: Any) -> None:
+            extra = message.record["extra"]
+            inner_seconds[extra["stage"]] = inner_seconds.get(extra["stage"], 0) + extra["seconds"]
+
+        sink = logger.add(
+            record_inner,
+            level="DEBUG",
+            filter=lambda record: "stage" in record["extra"] and "seconds" in record["extra"],
+        )
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = function()
+        finally:
+            result_row = {"stage": name, "seconds": time.perf_counter() - start}
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result_row["peak_mb"] = peak / 1e6
+            logger.remove(sink)
+        self.results.append(result_row)
+        self.results.extend(
+            {"stage": f"{name} / {stage}", "seconds": seconds}
+            for stage, seconds in inner_seconds.items()
+        )
+        return result
+
+
+def run_benchmark(n_sites: int, stub: QuartzStub, args: argparse.Namespace) -> list[dict[str, Any]]:
+    """Run the pages' functions for some sites, returning the timings of each stage."""
+    sites = make_sites(n_sites)
+    stages = Stages(trace_memory=args.memory)
+
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        cache = ForecastCache(str(Path(tmp) / "forecasts.sqlite"))
+        client = ForecastClient(url=stub.url, batch_url=stub.batch_url)
+        stack.enter_context(patch("forecast.get_forecast_cache", return_value=cache))
+        stack.enter_context(patch("forecast.get_client", return_value=client))
+        stack.enter_context(
+            patch(
+                "forecast.get_forecasts",
+                functools.partial(get_forecasts, batch_size=args.batch_size),
+            ),
+        )
+
+        # main page, as when there is no snapshot yet
+        forecasts = stages.run(
+            "country forecasts",
+            lambda: get_country_forecasts(
+                sites,
+                max_workers=args.max_in_flight,
+                fresh=True,
+                multi_point=False,
+            ),
+        )
+        if forecasts is None:
+            logger.error(f"No forecasts for {n_sites} sites")
+            return []
+
+        cube = build_forecast_cube(forecasts)
+        stages.run("aggregates", lambda: aggregate_forecasts(cube))
+
+        country_codes = get_map_country_codes(default_detail_level)
+        stages.run(
+            "map frame",
+            lambda: to_streamlit_json(
+                make_map_figure(
+                    default_detail_level,
+                    z=cube.values_at(0, country_codes),
+                    colorbar_title="Power [GW]",
+                ),
+            ),
+        )
+
+        def animated_map() -> str:
+            frames = np.flatnonzero(cube.timestamps.minute == 0)
+            figure = make_animated_map_figure(
+                default_detail_level,
+                frame_labels=list(cube.timestamps[frames].strftime("%a %H:%M")),
+                frame_z=cube.values_at(frames, country_codes),
+                colorbar_title="Power [GW]",
+            )
+            return to_streamlit_json(figure)
+
+        stages.run("animated map", animated_map)
+
+        # country page, from the cache
+        def country_pages() -> None:
+            for key in list(sites)[:country_page_runs]:
+                name, capacity, lat, lon = sites[key]
+                forecast_data = get_forecast(name, capacity, lat, lon)
+                if forecast_data is not None:
+                    smooth_predictions(forecast_data)
+
+        stages.run(f"country page x{country_page_runs}", country_pages)
+
+    for result in stages.results:
+        result["sites"] = n_sites
+    return stages.results
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the forecast pipeline.")
+    parser.add_argument("--sites", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503s")
+    parser.add_argument("--recording", type=Path, help="Recorded API response to replay")
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="Also measure peak memory")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    # the app loads these once per process, so keep them out of the first run's timings
+    importlib.import_module("scipy.signal")
+    importlib.import_module("scipy.sparse")
+    load_region_table()
+    get_map_country_codes(default_detail_level)
+
+    results = []
+    with QuartzStub(
+        latency_seconds=args.latency,
+        jitter_seconds=args.jitter,
+        error_rate=args.error_rate,
+        recording=args.recording,
+        seed=0,
+    ) as stub:
+        for n_sites in args.sites:
+            results.extend(run_benchmark(n_sites, stub, args))
+
+    table = pd.DataFrame(results).pivot_table(
+        index="stage",
+        columns="sites",
+        values=["seconds", "peak_mb"] if args.memory else ["seconds"],
+        sort=False,
+    )
+    print(table.round(3).to_string())  # noqa: T201
+
+    if args.json is not None:
+        args.json.write_text(json.dumps({"settings": vars(args), "results": results}, default=str))
+
+
+if __name__ == "__main__":
+    main()
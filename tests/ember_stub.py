@@ -0,0 +1,109 @@
+"""A local stand-in for Ember's data downloads, for testing the capacities ingest offline.
+
+It serves a small file in Ember's long format at `url`, with an ETag and Last-Modified,
+and answers conditional requests for an unchanged file with `304 Not Modified`.
+"""
+
+import hashlib
+import threading
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+
+import pandas as pd
+
+
+def make_long_format_csv(solar_gw: float = 20.0) -> str:
+    """Make a small csv in Ember's long format, with GBR's 2024 solar capacity in GW."""
+    rows = []
+    for area, code in [("United Kingdom", "GBR"), ("France", "FRA"), ("World", None)]:
+        for year in [2023, 2024]:
+            for category, variable, value in [
+                ("Capacity", "Solar", 10.0),
+                ("Capacity", "Wind", 30.0),
+                ("Electricity generation", "Solar", 15.0),
+            ]:
+                if code == "GBR" and year == 2024 and variable == "Solar":
+                    value = solar_gw if category == "Capacity" else value
+                rows.append(
+                    {
+                        "Area": area,
+                        "ISO 3 code": code,
+                        "Year": year,
+                        "Area type": "Country" if code else "Region",
+                        "Category": category,
+                        "Variable": variable,
+                        "Unit": "GW",
+                        "Value": value + year - 2023,
+                    },
+                )
+    return pd.DataFrame(rows).to_csv(index=False)
+
+
+class EmberStub:
+    """The stand-in download server, served from a background thread.
+
+    Use it as a context manager, and change `content` to publish a new version of the file.
+    """
+
+    def __init__(self, content: str) -> None:
+        """Create the stub, serving some csv content."""
+        self.content = content
+        self.last_modified = formatdate(usegmt=True)
+        # number of responses sent, by status code
+        self.responses: Counter[int] = Counter()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """The url of the long format csv."""
+        return f"http://127.0.0.1:{self.server.server_port}/yearly_full_release_long_format.csv"
+
+    @property
+    def etag(self) -> str:
+        """The ETag of the current content."""
+        return '"' + hashlib.sha256(self.content.encode()).hexdigest()[:16] + '"'
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                if self.headers.get("If-None-Match") == stub.etag:
+                    stub.responses[304] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", stub.etag)
+                    self.end_headers()
+                    return
+
+                content = stub.content.encode()
+                stub.responses[200] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("ETag", stub.etag)
+                self.send_header("Last-Modified", stub.last_modified)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "EmberStub":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,223 @@
+"""A local stand-in for the Quartz Open Solar forecast API, for testing offline.
+
+It serves `POST /forecast/` for single sites, and `POST /forecast/batch/` for many sites
+in one request, returning a simple clear sky profile scaled by each site's capacity.
+It can instead replay a response recorded from the real API, and can be made slow or
+unreliable, with a latency, jitter and rate of `503` errors for each request.
+
+To run it for the app:
+    python -m tests.quartz_stub --port 8080
+    FORECAST_API_URL=http://localhost:8080/forecast/ streamlit run src/v1/main.py
+
+To record a response from the real API, and replay it:
+    python -m tests.quartz_stub --record recording.json --lat 51.5 --lon -0.1
+    python -m tests.quartz_stub --port 8080 --recording recording.json
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+import pandas as pd
+import requests
+
+
+def make_predictions(site: dict[str, float], timestamp: str) -> dict[str, dict[str, float]]:
+    """Make 48 hours of 15 minute predictions for a site, in the API's format."""
+    start = pd.Timestamp(timestamp).floor("h")
+    predictions = {}
+    for i in range(48 * 4):
+        time = start + pd.Timedelta(minutes=15 * i)
+        solar_hour = (time.hour + time.minute / 60 + site["longitude"] / 15) % 24
+        clear_sky = max(0.0, math.sin((solar_hour - 6) / 12 * math.pi))
+        predictions[str(time)] = round(0.8 * clear_sky * site["capacity_kwp"], 6)
+    return {"power_kw": predictions}
+
+
+def record_response(path: Path, lat: float, lon: float, url: str) -> None:
+    """Record a response of the real API for a 1 kW site, to replay with `QuartzStub`."""
+    site = {
+        "latitude": lat,
+        "longitude": lon,
+        "capacity_kwp": 1.0,
+        "tilt": abs(lat) / 2,
+        "orientation": 180 if lat > 0 else 0,
+    }
+    timestamp = pd.Timestamp.now(tz="UTC").floor("h").replace(tzinfo=None).isoformat()
+    r = requests.post(url, json={"site": site, "timestamp": timestamp}, timeout=60)
+    r.raise_for_status()
+    path.write_text(json.dumps({"site": site, "response": r.json()}))
+
+
+def replay_predictions(
+    recording: dict[str, Any],
+    site: dict[str, float],
+    timestamp: str,
+) -> dict[str, dict[str, float]]:
+    """Replay a recorded response for a site, scaled to its capacity and moved to a timestamp.
+
+    The recorded values are replayed in order from the requested timestamp, so the profile
+    keeps its shape but is not moved for the site's longitude.
+    """
+    recorded = recording["response"]["predictions"]["power_kw"]
+    scale = site["capacity_kwp"] / recording["site"]["capacity_kwp"]
+    start = pd.Timestamp(timestamp).floor("h")
+    return {
+        "power_kw": {
+            str(start + pd.Timedelta(minutes=15 * i)): round(value * scale, 6)
+            for i, value in enumerate(recorded.values())
+        },
+    }
+
+
+class QuartzStub:
+    """The stand-in API, served from a background thread.
+
+    Use it as a context manager, and point the client at `url` and `batch_url`.
+    """
+
+    def __init__(
+        self,
+        batch: bool = True,
+        port: int = 0,
+        latency_seconds: float = 0.0,
+        jitter_seconds: float = 0.0,
+        error_rate: float = 0.0,
+        recording: Path | None = None,
+        seed: int | None = None,
+    ) -> None:
+        """Create the stub on a port (0 for any free one).
+
+        Args:
+            batch: Whether to support batch requests
+            port: Port to serve on, 0 for any free one
+            latency_seconds: Time each request takes
+            jitter_seconds: Up to this much random time is added to each request
+            error_rate: Fraction of requests that fail with a `503`
+            recording: A response recorded with `record_response` to replay, rather than
+                a clear sky profile
+            seed: Seed for the random jitter and errors
+        """
+        self.batch = batch
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.recording = None if recording is None else json.loads(recording.read_text())
+        self.random = random.Random(seed)  # noqa: S311
+        self.requests: Counter[str] = Counter()
+        self.errors = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """The single site forecast url."""
+        return f"http://127.0.0.1:{self.server.server_port}/forecast/"
+
+    @property
+    def batch_url(self) -> str:
+        """The batch forecast url."""
+        return f"{self.url}batch/"
+
+    def predict(self, site: dict[str, float], timestamp: str) -> dict[str, dict[str, float]]:
+        """Make the predictions for a site, replaying the recording if there is one."""
+        if self.recording is not None:
+            return replay_predictions(self.recording, site, timestamp)
+        return make_predictions(site, timestamp)
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # the headers and body are written separately, so don't wait for acks in between
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                stub.requests[self.path] += 1
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+                time.sleep(stub.latency_seconds + stub.random.uniform(0, stub.jitter_seconds))
+                if stub.random.random() < stub.error_rate:
+                    stub.errors += 1
+                    self.send_error(503)
+                    return
+
+                if self.path == "/forecast/":
+                    response = {
+                        "timestamp": body["timestamp"],
+                        "predictions": stub.predict(body["site"], body["timestamp"]),
+                    }
+                elif self.path == "/forecast/batch/" and stub.batch:
+                    response = {
+                        "timestamp": body["timestamp"],
+                        "predictions": [
+                            stub.predict(site, body["timestamp"]) for site in body["sites"]
+                        ],
+                    }
+                else:
+                    self.send_error(404)
+                    return
+
+                content = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "QuartzStub":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the forecast API.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-batch", action="store_true", help="Do not support batches")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503s")
+    parser.add_argument("--recording", type=Path, help="Recorded response to replay")
+    parser.add_argument("--record", type=Path, help="Record a real response to this file")
+    parser.add_argument("--lat", type=float, default=51.5, help="Latitude to record")
+    parser.add_argument("--lon", type=float, default=-0.1, help="Longitude to record")
+    parser.add_argument("--url", default="https://open.quartz.solar/forecast/")
+    args = parser.parse_args()
+
+    if args.record is not None:
+        record_response(args.record, args.lat, args.lon, args.url)
+        raise SystemExit
+
+    stub = QuartzStub(
+        batch=not args.no_batch,
+        port=args.port,
+        latency_seconds=args.latency,
+        jitter_seconds=args.jitter,
+        error_rate=args.error_rate,
+        recording=args.recording,
+    )
+    print(f"Serving forecasts at {stub.url}")  # noqa: T201
+    stub.server.serve_forever()
@@ -0,0 +1,126 @@
+import gzip
+import http.client
+import io
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import api
+import pandas as pd
+import requests
+import snapshot
+from capacities import load_capacity_table
+
+from tests.test_snapshot import make_snapshot
+
+
+class TestApi(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch("snapshot.snapshot_dir", Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        server = api.make_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.port = server.server_port
+        self.url = f"http://127.0.0.1:{server.server_port}/api/v1"
+
+    def test_no_snapshot(self) -> None:
+        r = requests.get(f"{self.url}/global", timeout=5)
+        self.assertEqual(r.status_code, 503)
+
+    def test_metrics(self) -> None:
+        r = requests.get(f"http://127.0.0.1:{self.port}/metrics", timeout=5)
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("# TYPE solar_forecast_stage_seconds histogram", r.text)
+
+    def test_head_errors_have_no_body(self) -> None:
+        # on one connection, so a body sent after the first headers would garble the second
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        self.addCleanup(conn.close)
+        for method, path in [("HEAD", "/unknown"), ("HEAD", "/api/v1/global"), ("GET", "/x")]:
+            conn.request(method, path)
+            r = conn.getresponse()
+            body = r.read()
+            self.assertIn(r.status, [404, 503])
+            self.assertEqual(body == b"", method == "HEAD")
+
+    def test_resources(self) -> None:
+        snapshot.write_snapshot(make_snapshot("20250101T000500Z"), missing=[])
+
+        r = requests.get(f"{self.url}/global", timeout=5)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["version"], "20250101T000500Z")
+        self.assertEqual(
+            r.json()["data"][1],
+            {
+                "timestamp": "2025-01-01T00:15:00Z",
+                "power_gw": 1.0,
+                # of the capacity of the countries in the snapshot, only GBR
+                "power_percentage": 1.0 / load_capacity_table().capacity_per_country["GBR"] * 100,
+            },
+        )
+
+        r = requests.get(f"{self.url}/countries/gbr?format=parquet", timeout=5)
+        self.assertEqual(r.headers["Content-Type"], "application/vnd.apache.parquet")
+        columns = ["timestamp", "country_code", "power_gw", "power_percentage"]
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(io.BytesIO(r.content)),
+            make_snapshot("x").forecasts[columns],
+        )
+
+        r = requests.get(f"{self.url}/regions", timeout=5)
+        europe = [row for row in r.json()["data"] if row["region"] == "Europe"]
+        self.assertEqual([row["power_gw"] for row in europe], [0.0, 1.0])
+
+        r = requests.get(f"{self.url}/capacities", timeout=5)
+        self.assertIn("GBR", [row["country_code"] for row in r.json()["data"]])
+
+        for path in ["/countries/FRA", "/unknown"]:
+            r = requests.get(f"{self.url}{path}", timeout=5)
+            self.assertEqual(r.status_code, 404)
+
+    def test_etag_and_compression(self) -> None:
+        snapshot.write_snapshot(make_snapshot("20250101T000500Z"), missing=[])
+
+        r = requests.get(f"{self.url}/countries", headers={"Accept-Encoding": "gzip"}, timeout=5)
+        self.assertEqual(r.headers["Content-Encoding"], "gzip")
+        etag = r.headers["ETag"]
+
+        plain = requests.get(f"{self.url}/countries", headers={"Accept-Encoding": ""}, timeout=5)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertNotEqual(plain.headers["ETag"], etag)
+        self.assertEqual(plain.content, r.content)
+        self.assertEqual(
+            gzip.decompress(
+                api.render_encoded("20250101T000500Z", "countries", "json", "gzip").body,
+            ),
+            plain.content,
+        )
+
+        r = requests.get(
+            f"{self.url}/countries",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+            timeout=5,
+        )
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.headers["ETag"], etag)
+        self.assertEqual(r.content, b"")
+
+        # a new snapshot has a new ETag
+        new_snapshot = make_snapshot("20250101T010500Z")
+        new_snapshot.forecasts["power_gw"] *= 2
+        snapshot.write_snapshot(new_snapshot, missing=[])
+        r = requests.get(
+            f"{self.url}/countries",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+            timeout=5,
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r.headers["ETag"], etag)
@@ -0,0 +1,54 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import forecast
+import pandas as pd
+from cache import ForecastCache
+from client import ForecastClient
+
+from tests.quartz_stub import QuartzStub
+
+SITES = {f"C{i}": (f"Country {i}", float(i + 1), 10.0 * i, 5.0 * i) for i in range(5)}
+
+
+class TestBatchForecasts(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache = ForecastCache(str(Path(tmp.name) / "forecasts.sqlite"))
+        patcher = patch("forecast.get_forecast_cache", return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_forecasts(self, stub: QuartzStub, batch_size: int) -> dict[str, pd.DataFrame]:
+        client = ForecastClient(url=stub.url, batch_url=stub.batch_url)
+        with patch("forecast.get_client", return_value=client):
+            forecasts = forecast.get_forecasts(SITES, fresh=True, batch_size=batch_size)
+            return {
+                key: forecast_data for key, forecast_data in forecasts if forecast_data is not None
+            }
+
+    def test_batches_match_single_requests(self) -> None:
+        with QuartzStub() as stub:
+            single = self.get_forecasts(stub, batch_size=1)
+            self.assertEqual(stub.requests["/forecast/"], 5)
+
+            batched = self.get_forecasts(stub, batch_size=2)
+            self.assertEqual(stub.requests["/forecast/batch/"], 3)
+            self.assertEqual(stub.requests["/forecast/"], 5)
+
+        for key in SITES:
+            pd.testing.assert_frame_equal(batched[key], single[key])
+
+    def test_falls_back_to_single_requests(self) -> None:
+        with QuartzStub(batch=False) as stub:
+            forecasts = self.get_forecasts(stub, batch_size=2)
+
+            # one batch request finds out batches are not supported
+            self.assertEqual(stub.requests["/forecast/batch/"], 1)
+            self.assertEqual(stub.requests["/forecast/"], 5)
+
+        self.assertEqual(set(forecasts), set(SITES))
+        self.assertTrue(all(f is not None for f in forecasts.values()))
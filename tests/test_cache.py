@@ -0,0 +1,90 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import forecast
+import pandas as pd
+from cache import ForecastCache, current_forecast_hour, max_stale_hours, site_key
+
+
+def hours_ago(hours: int) -> str:
+    return (pd.Timestamp(current_forecast_hour()) - pd.Timedelta(hours=hours)).isoformat()
+
+
+def make_forecast(value: float) -> pd.DataFrame:
+    return pd.DataFrame(
+        {"power_kw": [0.0, value]},
+        index=["2025-01-01 00:00:00", "2025-01-01 00:15:00"],
+    )
+
+
+class TestForecastCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "forecasts.sqlite")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def get_cached(self, cache: ForecastCache, key: str) -> tuple[str, pd.DataFrame]:
+        cached = cache.get(key)
+        if cached is None:
+            self.fail(f"{key} is not cached")
+        return cached
+
+    def test_survives_restart(self) -> None:
+        ForecastCache(self.path).put("a", "2025-01-01T00:00:00", make_forecast(1.0))
+        ForecastCache(self.path).put("a", "2025-01-01T01:00:00", make_forecast(2.0))
+
+        # a new instance has an empty memory, so this reads from disk
+        forecast_hour, cached = self.get_cached(ForecastCache(self.path), "a")
+
+        self.assertEqual(forecast_hour, "2025-01-01T01:00:00")
+        pd.testing.assert_frame_equal(cached, make_forecast(2.0))
+        self.assertIsNone(ForecastCache(self.path).get("b"))
+
+    def test_stale_while_revalidate(self) -> None:
+        cache = ForecastCache(self.path)
+        key = site_key(1.0, 10.0, 20.0)
+        stale_hour = hours_ago(1)
+        cache.put(key, stale_hour, make_forecast(1.0))
+
+        with (
+            patch("forecast.get_forecast_cache", return_value=cache),
+            patch("forecast.fetch_forecast", return_value=make_forecast(2.0)) as fetch,
+        ):
+            stale = forecast.get_forecast("A", 1.0, 10.0, 20.0)
+            if stale is None:
+                self.fail("no forecast")
+
+            # the stale result is returned straight away, and refreshed in the background
+            pd.testing.assert_frame_equal(stale, make_forecast(1.0))
+            for _ in range(50):
+                if self.get_cached(cache, key)[0] != stale_hour:
+                    break
+                time.sleep(0.1)
+
+        fetch.assert_called_once()
+        pd.testing.assert_frame_equal(self.get_cached(cache, key)[1], make_forecast(2.0))
+
+    def test_too_stale_is_a_miss(self) -> None:
+        cache = ForecastCache(self.path)
+        key = site_key(1.0, 10.0, 20.0)
+        cache.put(key, hours_ago(max_stale_hours + 1), make_forecast(1.0))
+
+        with (
+            patch("forecast.get_forecast_cache", return_value=cache),
+            patch("forecast.fetch_forecast", return_value=make_forecast(2.0)) as fetch,
+            patch("forecast.refresh_in_background") as refresh,
+        ):
+            fresh = forecast.get_forecast("A", 1.0, 10.0, 20.0)
+        if fresh is None:
+            self.fail("no forecast")
+
+        # the old forecast is not served, the new one is fetched before returning
+        pd.testing.assert_frame_equal(fresh, make_forecast(2.0))
+        fetch.assert_called_once()
+        refresh.assert_not_called()
+        self.assertEqual(self.get_cached(cache, key)[0], current_forecast_hour())
@@ -0,0 +1,41 @@
+import unittest
+
+import pandas as pd
+from capacities import load_capacity_table, validate_capacities
+
+
+def make_capacities(**columns: list[object]) -> pd.DataFrame:
+    capacities = {
+        "country_code": ["GBR", "FRA"],
+        "capacity_gw": [20.0, 25.0],
+        "country_name": ["United Kingdom", "France"],
+        "source": ["Ember", "Ember"],
+    }
+    return pd.DataFrame({**capacities, **columns})
+
+
+class TestCapacities(unittest.TestCase):
+    def test_load_capacity_table(self) -> None:
+        capacities = load_capacity_table()
+
+        self.assertEqual(len(capacities.labels), len(capacities.table))
+        self.assertIn("GBR - United Kingdom", capacities.labels)
+        self.assertAlmostEqual(
+            capacities.global_capacity_gw,
+            sum(capacities.capacity_per_country.values()),
+        )
+        self.assertIsInstance(capacities.capacity_per_country["GBR"], float)
+
+    def test_drops_rows_without_a_country_code(self) -> None:
+        capacities = validate_capacities(make_capacities(country_code=["GBR", None]))
+        self.assertEqual(list(capacities["country_code"]), ["GBR"])
+
+    def test_invalid_capacities(self) -> None:
+        for capacities in [
+            make_capacities().drop(columns="capacity_gw"),
+            make_capacities(country_code=["GBR", "GBR"]),
+            make_capacities(capacity_gw=[20.0, None]),
+            make_capacities(capacity_gw=[20.0, -1.0]),
+        ]:
+            with self.assertRaises(ValueError):
+                validate_capacities(capacities)
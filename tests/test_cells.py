@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+import forecast
+import numpy as np
+import pandas as pd
+from cells import CountryCells, combine_cells, expand_sites, load_country_cells, site_country
+
+CELLS = {
+    "BIG": CountryCells(
+        lats=np.array([10.0, 20.0]),
+        lons=np.array([30.0, 40.0]),
+        weights=np.array([0.75, 0.25]),
+    ),
+}
+
+INDEX = pd.date_range("2025-01-01", periods=12, freq="15min").astype(str)
+
+
+def lat_forecast(_name: str, capacity: float, lat: float, _lon: float) -> pd.DataFrame:
+    # a forecast that is easy to tell apart for each cell
+    return pd.DataFrame({"power_kw": np.full(len(INDEX), capacity * lat)}, index=INDEX)
+
+
+class TestCells(unittest.TestCase):
+    def test_cells_are_valid(self) -> None:
+        for country_code, cells in load_country_cells().items():
+            self.assertAlmostEqual(cells.weights.sum(), 1, places=4, msg=country_code)
+            self.assertTrue((cells.weights > 0).all(), country_code)
+            self.assertTrue((np.abs(cells.lats) <= 90).all(), country_code)
+        self.assertIn("USA", load_country_cells())
+
+    def test_expand_sites(self) -> None:
+        sites = {"BIG": ("Big", 4.0, 15.0, 35.0), "SML": ("Small", 1.0, 1.0, 2.0)}
+
+        with patch("cells.load_country_cells", return_value=CELLS):
+            expanded, weights = expand_sites(sites)
+
+        self.assertEqual(list(expanded), ["BIG:0", "BIG:1", "SML"])
+        self.assertEqual(expanded["BIG:1"], ("Big (cell 1)", 4.0, 20.0, 40.0))
+        self.assertEqual(expanded["SML"], sites["SML"])
+        self.assertEqual(weights, {"BIG:0": 0.75, "BIG:1": 0.25, "SML": 1.0})
+        self.assertEqual([site_country(key) for key in expanded], ["BIG", "BIG", "SML"])
+
+    def test_combine_cells_rescales_weights(self) -> None:
+        a = pd.DataFrame({"power_kw": [1.0, 2.0, 3.0]}, index=["t0", "t1", "t2"])
+        b = pd.DataFrame({"power_kw": [5.0, 6.0]}, index=["t1", "t2"])
+
+        combined = combine_cells([a, b], [0.3, 0.1])
+
+        self.assertEqual(list(combined.index), ["t1", "t2"])
+        np.testing.assert_allclose(combined["power_kw"], [0.75 * 2 + 0.25 * 5, 0.75 * 3 + 0.25 * 6])
+
+    def test_country_forecasts_from_cells(self) -> None:
+        sites = {"BIG": ("Big", 4.0, 15.0, 35.0), "SML": ("Small", 1.0, 1.0, 2.0)}
+        progress = []
+
+        with (
+            patch("cells.load_country_cells", return_value=CELLS),
+            patch("forecast.get_forecast", side_effect=lat_forecast) as get_forecast,
+        ):
+            forecasts = forecast.get_country_forecasts(
+                sites,
+                progress=lambda done, _name: progress.append(done),
+                multi_point=True,
+            )
+
+        if forecasts is None:
+            self.fail("no forecasts")
+        self.assertEqual(get_forecast.call_count, 3)
+        self.assertEqual(sorted(progress), [1, 2])
+        power_gw = forecasts.groupby("country_code")["power_gw"].max()
+        # the weighted sum of the cells, 4 * (0.75 * 10 + 0.25 * 20)
+        self.assertAlmostEqual(power_gw["BIG"], 50.0)
+        self.assertAlmostEqual(power_gw["SML"], 1.0)
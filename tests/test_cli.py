@@ -0,0 +1,46 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import cli
+import pandas as pd
+from cache import ForecastCache
+from client import ForecastClient
+
+from tests.quartz_stub import QuartzStub
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        cache = ForecastCache(str(self.tmp / "forecasts.sqlite"))
+        patcher = patch("forecast.get_forecast_cache", return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_writes_country_and_global_forecasts(self) -> None:
+        output = self.tmp / "out"
+        with QuartzStub() as stub:
+            client = ForecastClient(url=stub.url, batch_url=stub.batch_url)
+            with patch("forecast.get_client", return_value=client):
+                exit_code = cli.main(
+                    ["--output", str(output), "--format", "csv", "--countries", "gbr", "FRA"],
+                )
+
+        self.assertEqual(exit_code, 0)
+        countries = pd.read_csv(output / "countries.csv")
+        world = pd.read_csv(output / "global.csv")
+
+        self.assertEqual(set(countries["country_code"]), {"GBR", "FRA"})
+        self.assertEqual(len(world), countries["timestamp"].nunique())
+        pd.testing.assert_series_equal(
+            world.set_index("timestamp")["power_gw"],
+            countries.groupby("timestamp")["power_gw"].sum(),
+        )
+
+    def test_unknown_country(self) -> None:
+        with self.assertRaises(SystemExit):
+            cli.main(["--countries", "XXX"])
@@ -0,0 +1,86 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import orjson
+import pandas as pd
+import requests
+from client import ForecastClient, decode_predictions
+
+from tests.quartz_stub import QuartzStub
+
+PREDICTIONS = {
+    "power_kw": {"2025-01-01 00:00:00": 0.0, "2025-01-01 00:15:00": 1.5},
+}
+
+
+def make_response(status_code: int) -> requests.Response:
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = orjson.dumps({"predictions": PREDICTIONS})
+    return r
+
+
+class TestForecastClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = ForecastClient(url="http://forecast.test/", backoff_seconds=0)
+
+    def test_decode_predictions(self) -> None:
+        pd.testing.assert_frame_equal(decode_predictions(PREDICTIONS), pd.DataFrame(PREDICTIONS))
+
+    def test_retries_transient_status(self) -> None:
+        responses = [make_response(503), make_response(200)]
+        with patch.object(self.client.session, "post", side_effect=responses) as post:
+            predictions = self.client.get_predictions({"latitude": 1.0}, "2025-01-01T00:00:00")
+
+        if predictions is None:
+            self.fail("no predictions after retrying")
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(predictions["power_kw"].tolist(), [0.0, 1.5])
+
+    def test_does_not_retry_client_errors(self) -> None:
+        with patch.object(self.client.session, "post", return_value=make_response(400)) as post:
+            self.assertIsNone(self.client.get_predictions({}, "2025-01-01T00:00:00"))
+
+        self.assertEqual(post.call_count, 1)
+
+    def test_gives_up_after_max_retries(self) -> None:
+        with (
+            patch.object(self.client.session, "post", side_effect=requests.ConnectionError),
+            self.assertRaises(requests.ConnectionError),
+        ):
+            self.client.get_predictions({}, "2025-01-01T00:00:00")
+
+
+SITE = {"latitude": 51.5, "longitude": -0.1, "capacity_kwp": 2.0}
+
+
+class TestAgainstStub(unittest.TestCase):
+    def test_gives_up_on_stub_errors(self) -> None:
+        with QuartzStub(error_rate=1.0) as stub:
+            client = ForecastClient(url=stub.url, backoff_seconds=0, max_retries=2)
+            self.assertIsNone(client.get_predictions(SITE, "2025-01-01T00:00:00"))
+
+        self.assertEqual(stub.errors, 3)
+
+    def test_replays_recording(self) -> None:
+        recording = {
+            "site": {"capacity_kwp": 1.0},
+            "response": {"predictions": PREDICTIONS},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "recording.json"
+            path.write_text(json.dumps(recording))
+            with QuartzStub(recording=path) as stub:
+                client = ForecastClient(url=stub.url)
+                predictions = client.get_predictions(SITE, "2025-06-01T12:00:00")
+
+        if predictions is None:
+            self.fail("no predictions from the recording")
+        self.assertEqual(predictions["power_kw"].tolist(), [0.0, 3.0])
+        self.assertEqual(
+            list(predictions.index),
+            ["2025-06-01 12:00:00", "2025-06-01 12:15:00"],
+        )
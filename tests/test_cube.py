@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from cube import aggregate_forecasts, build_forecast_cube
+
+
+def make_forecasts() -> pd.DataFrame:
+    timestamps = pd.date_range("2025-01-01", periods=8, freq="15min")
+    rng = np.random.default_rng(0)
+    forecasts = pd.DataFrame(
+        {
+            "timestamp": np.tile(timestamps, 3),
+            "power_gw": rng.uniform(0, 10, 24),
+            "country_code": np.repeat(["GBR", "DEU", "FRA"], 8),
+        },
+    )
+    forecasts["power_percentage"] = forecasts["power_gw"] * 10
+    # one country is missing a timestamp
+    return forecasts.drop(index=3).sample(frac=1, random_state=0)
+
+
+class TestForecastCube(unittest.TestCase):
+    def setUp(self) -> None:
+        self.forecasts = make_forecasts()
+        self.cube = build_forecast_cube(self.forecasts)
+
+    def test_matches_long_forecasts(self) -> None:
+        pivot = self.forecasts.pivot_table(
+            index="timestamp",
+            columns="country_code",
+            values="power_gw",
+            aggfunc="sum",
+        )
+        np.testing.assert_array_equal(self.cube.timestamps, pivot.index)
+        np.testing.assert_array_equal(self.cube.country_codes, pivot.columns)
+        np.testing.assert_allclose(self.cube.power_gw, pivot.to_numpy())
+
+        total = self.forecasts.groupby("timestamp")["power_gw"].sum()
+        np.testing.assert_allclose(self.cube.total_gw, total.to_numpy())
+
+    def test_total_percentage_of_countries_forecast(self) -> None:
+        capacities = {"GBR": 10.0, "DEU": 20.0, "FRA": 30.0, "ESP": 40.0}
+
+        total_percentage = self.cube.total_percentage(capacities)
+
+        # ESP has no forecast, so its capacity is left out
+        np.testing.assert_allclose(total_percentage, self.cube.total_gw / 60.0 * 100)
+
+    def test_values_at(self) -> None:
+        timestamp = self.cube.timestamps[3]
+        selected = self.forecasts[self.forecasts["timestamp"] == timestamp]
+        selected = selected.set_index("country_code").reindex(["FRA", "GBR", "XXX"])
+
+        np.testing.assert_allclose(
+            self.cube.values_at(3, ["FRA", "GBR", "XXX"]),
+            selected["power_gw"].to_numpy(),
+        )
+        np.testing.assert_allclose(
+            self.cube.values_at(3, ["FRA", "GBR", "XXX"], normalized=True),
+            selected["power_percentage"].to_numpy(),
+        )
+
+    def test_nearest_timestamp_index(self) -> None:
+        start = self.cube.timestamps[0]
+        for minutes, expected in [(-60, 0), (0, 0), (7.5, 0), (8, 1), (44, 3), (600, 7)]:
+            timestamp = start + pd.Timedelta(minutes=minutes)
+            self.assertEqual(self.cube.nearest_timestamp_index(timestamp), expected)
+
+    def test_top_countries(self) -> None:
+        top = self.cube.top_countries(2)
+
+        country_sums = self.cube.top_countries(3).sum().sort_values(ascending=False)
+        self.assertEqual(list(top.columns), [*country_sums.index[:2], "Other"])
+        np.testing.assert_allclose(top.sum(axis=1), np.nansum(self.cube.power_gw, axis=1))
+
+    def test_aggregates_match_groupby(self) -> None:
+        aggregates = aggregate_forecasts(self.cube, n=2)
+
+        total = self.forecasts.groupby("timestamp")["power_gw"].sum()
+        np.testing.assert_allclose(aggregates.total["power_gw"], total)
+        self.assertTrue(aggregates.timestamps.equals(pd.DatetimeIndex(total.index)))
+        self.assertEqual(len(aggregates.top_countries.columns), 3)
@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import forecast
+import numpy as np
+import pandas as pd
+import requests
+
+
+def slow_forecast(_name: str, capacity: float, _lat: float, _lon: float) -> pd.DataFrame:
+    time.sleep(0.2)
+    return pd.DataFrame({"power_kw": [capacity]})
+
+
+class TestGetForecasts(unittest.TestCase):
+    def test_runs_concurrently(self) -> None:
+        sites = {f"C{i:02d}": (f"Country {i}", float(i + 1), 0.0, 0.0) for i in range(8)}
+
+        start = time.perf_counter()
+        with patch("forecast.get_forecast", side_effect=slow_forecast):
+            results = dict(forecast.get_forecasts(sites, max_workers=8))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(set(results), set(sites))
+        c03 = results["C03"]
+        if c03 is None:
+            self.fail("no forecast for C03")
+        self.assertEqual(c03["power_kw"].iloc[0], 4.0)
+        self.assertLess(elapsed, 1.0)
+
+    def test_failed_request_gives_none(self) -> None:
+        sites = {"AAA": ("A", 1.0, 0.0, 0.0)}
+
+        with patch("forecast.get_forecast", side_effect=requests.Timeout):
+            results = dict(forecast.get_forecasts(sites))
+
+        self.assertIsNone(results["AAA"])
+
+    def test_deadline_leaves_out_slow_sites(self) -> None:
+        # the hanging site is somewhere no other test asks for, as it is still in flight after
+        sites = {"AAA": ("A", 1.0, 0.0, 0.0), "BBB": ("B", 2.0, 20.0, 20.0)}
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def hanging_forecast(name: str, capacity: float, lat: float, lon: float) -> pd.DataFrame:
+            if name == "B":
+                release.wait(10)
+            return slow_forecast(name, capacity, lat, lon)
+
+        start = time.perf_counter()
+        with patch("forecast.get_forecast", side_effect=hanging_forecast):
+            results = dict(forecast.get_forecasts(sites, deadline_seconds=0.5))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(list(results), ["AAA"])
+        self.assertLess(elapsed, 2.0)
+
+    def test_rerun_waits_on_requests_in_flight(self) -> None:
+        sites = {"AAA": ("A", 1.0, 0.0, 0.0), "BBB": ("B", 2.0, 10.0, 10.0)}
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def hanging_forecast(name: str, capacity: float, lat: float, lon: float) -> pd.DataFrame:
+            if name == "B":
+                release.wait(10)
+            return slow_forecast(name, capacity, lat, lon)
+
+        with patch("forecast.get_forecast", side_effect=hanging_forecast) as get_forecast:
+            first = dict(forecast.get_forecasts(sites, deadline_seconds=0.5))
+            second = dict(forecast.get_forecasts(sites, deadline_seconds=0.5))
+            release.set()
+            third = dict(forecast.get_forecasts(sites, deadline_seconds=5))
+
+            calls = [call.args[0] for call in get_forecast.call_args_list]
+
+        self.assertEqual(list(first), ["AAA"])
+        self.assertEqual(list(second), ["AAA"])
+        self.assertIsNotNone(third["BBB"])
+        # B was only requested once, and later calls waited on that request
+        self.assertEqual(calls.count("B"), 1)
+
+    def test_normalised_sites_share_request(self) -> None:
+        sites = {
+            "AAA": ("A", 2.0, 10.01, 20.02),
+            "BBB": ("B", 5.0, 9.99, 19.98),
+            "CCC": ("C", 1.0, 40.0, 50.0),
+        }
+
+        with (
+            patch("forecast.normalised_forecasts", True),
+            patch("forecast.get_forecast", side_effect=slow_forecast) as get_forecast,
+        ):
+            results = dict(forecast.get_forecasts(sites))
+
+        # one request per grid point, each for a unit capacity
+        self.assertEqual(get_forecast.call_count, 2)
+        get_forecast.assert_any_call("A", 1.0, 10.0, 20.0)
+        first_power_kw = {
+            key: forecast_data["power_kw"].iloc[0]
+            for key, forecast_data in results.items()
+            if forecast_data is not None
+        }
+        self.assertEqual(first_power_kw, {"AAA": 2.0, "BBB": 5.0, "CCC": 1.0})
+
+
+class TestSmoothForecasts(unittest.TestCase):
+    def test_matches_smoothing_one_at_a_time(self) -> None:
+        rng = np.random.default_rng(0)
+        forecasts = []
+        for length in [192, 192, 96, 192, 20]:
+            index = pd.date_range("2025-01-01", periods=length, freq="15min").astype(str)
+            power_kw = rng.uniform(0, 5, length)
+            # night time
+            power_kw[: length // 4] = 0
+            forecasts.append(pd.DataFrame({"power_kw": power_kw}, index=index))
+
+        smoothed = forecast.smooth_forecasts(forecasts)
+
+        self.assertEqual(len(smoothed), len(forecasts))
+        for predictions, batched in zip(forecasts, smoothed, strict=True):
+            pd.testing.assert_frame_equal(batched, forecast.smooth_predictions(predictions))
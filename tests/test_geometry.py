@@ -0,0 +1,37 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import geometry
+from registry import load_country_registry
+
+
+class TestWorldGeometries(unittest.TestCase):
+    def test_geometries_are_up_to_date(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch("geometry.data_dir", tmp):
+                geometry.build_world_geometries()
+                rebuilt = {
+                    level: Path(geometry.geometry_path(level)).read_text()
+                    for level in geometry.detail_levels
+                }
+
+            for level, content in rebuilt.items():
+                self.assertEqual(content, Path(geometry.geometry_path(level)).read_text())
+
+    def test_levels_share_countries(self) -> None:
+        registry = load_country_registry()
+        sizes = []
+        for level in geometry.detail_levels:
+            path = Path(geometry.geometry_path(level))
+            features = geometry.load_world_geojson(level)["features"]
+            sizes.append(path.stat().st_size)
+
+            # features are in the same order as the registry's geometry rows
+            on_map = registry[registry["geometry_row"] >= 0]
+            for country_code, row in on_map.iterrows():
+                self.assertEqual(features[row["geometry_row"]]["id"], country_code)
+
+        # less detail is smaller
+        self.assertEqual(sizes, sorted(sizes))
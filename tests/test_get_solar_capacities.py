@@ -0,0 +1,55 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+from data import get_solar_capacities
+
+from tests.ember_stub import EmberStub, make_long_format_csv
+
+
+class TestGetSolarCapacities(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def test_filters_while_reading(self) -> None:
+        csv = make_long_format_csv()
+
+        chunked = get_solar_capacities.read_ember_capacities(io.StringIO(csv), chunksize=5)
+
+        df = pd.read_csv(io.StringIO(csv))
+        df = df[(df["Year"] == 2024) & (df["Category"] == "Capacity") & (df["Variable"] == "Solar")]
+        self.assertEqual(list(chunked["country_name"]), list(df["Area"]))
+        self.assertEqual(list(chunked["capacity_gw"]), list(df["Value"]))
+        self.assertEqual(chunked["capacity_gw"][0], 21.0)
+
+    def test_conditional_refresh(self) -> None:
+        cache_dir = self.tmp / "ember"
+        capacities_path = self.tmp / "solar_capacities.csv"
+
+        def update() -> bool:
+            ember = get_solar_capacities.fetch_ember_capacities(stub.url, cache_dir, chunksize=5)
+            capacities = get_solar_capacities.build_capacities(ember)
+            return get_solar_capacities.write_if_changed(capacities, capacities_path)
+
+        with EmberStub(make_long_format_csv()) as stub:
+            self.assertTrue(update())
+            first = capacities_path.read_text()
+
+            # the file has not changed, so it is not downloaded or written again
+            self.assertFalse(update())
+            self.assertEqual(stub.responses, {200: 1, 304: 1})
+            self.assertEqual(capacities_path.read_text(), first)
+
+            stub.content = make_long_format_csv(solar_gw=25.0)
+            self.assertTrue(update())
+            self.assertEqual(stub.responses, {200: 2, 304: 1})
+
+        capacities = pd.read_csv(capacities_path, index_col="country_code")
+        self.assertEqual(capacities.loc["GBR", "capacity_gw"], 26.0)
+        self.assertEqual(capacities.loc["GBR", "source"], "Ember")
+        # manually added countries are included
+        self.assertIn("UKR", capacities.index)
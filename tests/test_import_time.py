@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+# modules only some pages or build scripts need, that are slow to import. plotly is not one of
+# them, as `import streamlit` imports plotly.graph_objects itself, so the pages import it at the top
+heavy_modules = ["scipy", "geopandas", "shapely", "pyproj", "pycountry"]
+
+# generous, so that this only fails if something heavy is imported at start up again
+import_time_budget_seconds = 5.0
+
+
+def measure_import(module: str) -> tuple[float, set[str]]:
+    """Import a module in a new process, returning its import time and the modules loaded."""
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parents[1],
+        env={**os.environ, "PYTHONPATH": "src/v1"},
+    )
+    # the last line of the import times is the module itself, in microseconds
+    lines = [line for line in result.stderr.splitlines() if line.startswith("import time:")]
+    cumulative_us = int(lines[-1].split("|")[1])
+    return cumulative_us / 1e6, set(result.stdout.split())
+
+
+class TestImportTime(unittest.TestCase):
+    def test_app_starts_without_heavy_imports(self) -> None:
+        seconds, modules = measure_import("main")
+
+        for module in heavy_modules:
+            self.assertNotIn(module, modules)
+        self.assertLess(seconds, import_time_budget_seconds)
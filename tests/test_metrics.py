@@ -0,0 +1,67 @@
+import unittest
+
+import requests
+from client import ForecastClient
+from loguru import logger
+from metrics import start_metrics_server, timed
+from prometheus_client import REGISTRY
+
+from tests.quartz_stub import QuartzStub
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics(unittest.TestCase):
+    def test_timed_records_stage_and_logs(self) -> None:
+        records = []
+        sink = logger.add(lambda message: records.append(message.record), level="DEBUG")
+        count = sample("solar_forecast_stage_seconds_count", stage="test_stage")
+        errors = sample("solar_forecast_stage_errors_total", stage="test_stage")
+        try:
+            with timed("test_stage", countries=3):
+                pass
+            with self.assertRaises(ValueError), timed("test_stage"):
+                raise ValueError
+        finally:
+            logger.remove(sink)
+
+        self.assertEqual(
+            sample("solar_forecast_stage_seconds_count", stage="test_stage"),
+            count + 2,
+        )
+        self.assertEqual(
+            sample("solar_forecast_stage_errors_total", stage="test_stage"),
+            errors + 1,
+        )
+        extra = [r["extra"] for r in records if r["extra"].get("stage") == "test_stage"]
+        self.assertEqual(extra[0]["countries"], 3)
+        self.assertFalse(extra[0]["failed"])
+        self.assertTrue(extra[1]["failed"])
+
+    def test_client_records_upstream_status(self) -> None:
+        name = "solar_forecast_upstream_requests_total"
+        with QuartzStub(error_rate=1.0) as stub:
+            before = sample(name, endpoint="single", status="503")
+            client = ForecastClient(url=stub.url, backoff_seconds=0, max_retries=1)
+            client.get_predictions({"latitude": 0.0}, "2025-01-01T00:00:00")
+
+        after = sample(name, endpoint="single", status="503")
+        self.assertEqual(after - before, 2)
+
+    def test_serves_metrics(self) -> None:
+        with timed("served_stage"):
+            pass
+        server = start_metrics_server(port=0)
+        if server is None:
+            self.fail("metrics server did not start")
+        try:
+            r = requests.get(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.headers["Content-Type"].startswith("text/plain"))
+        self.assertIn('solar_forecast_stage_seconds_count{stage="served_stage"}', r.text)
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+import profiling
+from profiling import hot_functions, profile_run, profiled, to_speedscope
+
+
+def busy_wait(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+    def test_profile_run_writes_speedscope_and_summary(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            with profile_run("test_page", Path(tmp)) as profiles:
+                busy_wait(0.2)
+                data = [bytearray(1_000_000) for _ in range(5)]
+            del data
+
+            profile = profiles[0]
+            speedscope = json.loads(profile.speedscope_path.read_text())
+            summary = profile.summary_path.read_text()
+
+        frame_names = [frame["name"] for frame in speedscope["shared"]["frames"]]
+        self.assertIn("busy_wait", frame_names)
+        samples = speedscope["profiles"][0]
+        self.assertEqual(len(samples["samples"]), len(samples["weights"]))
+        self.assertGreater(samples["endValue"], 0)
+        self.assertIn("busy_wait", summary)
+        self.assertGreaterEqual(profile.peak_memory_mb, 5)
+        self.assertGreaterEqual(profile.seconds, 0.2)
+
+    def test_overlapping_runs(self) -> None:
+        # the first run finishes while the second one is still tracing memory
+        first_started, first_done = threading.Event(), threading.Event()
+        results = []
+
+        def second_run(tmp: str) -> None:
+            first_started.wait(5)
+            with profile_run("second", Path(tmp)) as profiles:
+                first_done.wait(5)
+                data = bytearray(1_000_000)
+            del data
+            results.extend(profiles)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            thread = threading.Thread(target=second_run, args=(tmp,))
+            thread.start()
+            with profile_run("first", Path(tmp)) as profiles:
+                first_started.set()
+                time.sleep(0.05)
+            first_done.set()
+            thread.join(5)
+
+            self.assertEqual(len(profiles), 1)
+            self.assertEqual(len(results), 1)
+            self.assertGreaterEqual(results[0].peak_memory_mb, 1)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_hot_functions(self) -> None:
+        outer = ("outer", "a.py", 1)
+        inner = ("inner", "a.py", 5)
+        samples = Counter({(outer,): 1, (outer, inner): 3})
+
+        hot = hot_functions(samples)
+
+        self.assertEqual(hot.index[0], "inner (a.py:5)")
+        self.assertEqual(hot.loc["inner (a.py:5)", "self"], 3)
+        self.assertEqual(hot.loc["outer (a.py:1)", "self"], 1)
+        self.assertEqual(hot.loc["outer (a.py:1)", "total"], 4)
+        self.assertEqual(hot.loc["outer (a.py:1)", "total_percentage"], 100)
+
+    def test_to_speedscope_shares_frames(self) -> None:
+        outer = ("outer", "a.py", 1)
+        inner = ("inner", "a.py", 5)
+        speedscope = to_speedscope("test", Counter({(outer,): 1, (outer, inner): 3}), 0.002)
+
+        self.assertEqual(len(speedscope["shared"]["frames"]), 2)
+        self.assertEqual(speedscope["profiles"][0]["samples"], [[0], [0, 1]])
+        self.assertEqual(speedscope["profiles"][0]["weights"], [2, 6])
+
+    def test_profiled_only_when_requested(self) -> None:
+        calls = []
+
+        @profiled
+        def page() -> None:
+            calls.append(1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with (
+                patch.dict(os.environ, {"PROFILE_DIR": tmp}),
+                patch.object(profiling, "profile_pages", False),
+            ):
+                page()
+            self.assertEqual(list(Path(tmp).iterdir()), [])
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(page.__name__, "page")
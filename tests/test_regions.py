@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from cube import aggregate_forecasts, build_forecast_cube
+from regions import continents, country_groups, load_region_table, region_membership
+from registry import load_country_registry
+
+
+class TestRegions(unittest.TestCase):
+    def test_every_region_has_countries(self) -> None:
+        table = load_region_table()
+
+        self.assertEqual(
+            sorted(table["region"].unique()),
+            sorted([*continents, *country_groups]),
+        )
+        self.assertTrue(table["country_code"].isin(load_country_registry().index).all())
+        # every country with a forecast location is in one continent
+        continent_counts = table[table["region"].isin(continents)]["country_code"].value_counts()
+        self.assertEqual(continent_counts.max(), 1)
+        self.assertIn("SGP", continent_counts.index)
+
+    def test_rollup_matches_groupby(self) -> None:
+        table = load_region_table()
+        country_codes = pd.Index(["DEU", "FRA", "GBR", "USA", "XXX"])
+        rng = np.random.default_rng(0)
+        power_gw = rng.uniform(0, 10, (6, len(country_codes)))
+        power_gw[2, 1] = np.nan
+
+        membership = region_membership(country_codes)
+        rollup = pd.DataFrame(membership.rollup(power_gw), columns=membership.regions)
+
+        long = pd.DataFrame(np.nan_to_num(power_gw), columns=country_codes).T
+        expected = long.join(table.set_index("country_code")).groupby("region").sum().T
+        expected = expected.reindex(columns=membership.regions, fill_value=0.0)
+        np.testing.assert_allclose(rollup, expected)
+        np.testing.assert_allclose(rollup["EU"], np.nan_to_num(power_gw[:, :2]).sum(axis=1))
+        np.testing.assert_allclose(rollup["ASEAN"], 0)
+
+    def test_aggregates_have_regions(self) -> None:
+        forecasts = pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(["2025-01-01 00:00"] * 3),
+                "power_gw": [1.0, 2.0, 4.0],
+                "power_percentage": [10.0, 20.0, 40.0],
+                "country_code": ["GBR", "FRA", "JPN"],
+            },
+        )
+
+        regions = aggregate_forecasts(build_forecast_cube(forecasts)).regions
+
+        self.assertEqual(regions["Europe"].iloc[0], 3.0)
+        self.assertEqual(regions["EU"].iloc[0], 2.0)
+        self.assertEqual(regions["G7"].iloc[0], 7.0)
+        self.assertEqual(regions["Africa"].iloc[0], 0.0)
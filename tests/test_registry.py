@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import registry
+from capacities import load_capacity_table
+
+
+class TestCountryRegistry(unittest.TestCase):
+    def test_registry_is_up_to_date(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "country_registry.csv")
+            with patch("registry.registry_path", path):
+                registry.build_country_registry()
+            rebuilt = pd.read_csv(path, index_col="country_code")
+
+        pd.testing.assert_frame_equal(rebuilt, registry.load_country_registry())
+
+    def test_timezones_are_valid(self) -> None:
+        for timezone in registry.load_country_registry()["timezone"]:
+            ZoneInfo(timezone)
+
+    def test_sites(self) -> None:
+        sites = registry.get_sites()
+
+        name, capacity, lat, _ = sites["GBR"]
+        self.assertEqual(name, "United Kingdom")
+        self.assertGreater(capacity, 0)
+        self.assertAlmostEqual(lat, 54, delta=2)
+        # small states without geometries use the fallback coordinates
+        self.assertEqual(sites["SGP"][2:], (1.3521, 103.8198))
+        self.assertIn("MUS", sites)
+
+    def test_sites_use_latest_capacities(self) -> None:
+        capacities = load_capacity_table()
+        updated = {**capacities.capacity_per_country, "GBR": 123.0, "FRA": 0.0, "XXX": 1.0}
+
+        with (
+            patch(
+                "registry.load_capacity_table",
+                return_value=replace(capacities, capacity_per_country=updated),
+            ),
+            patch("registry.warn_unlocated") as warn_unlocated,
+        ):
+            sites = registry.get_sites()
+
+        self.assertEqual(sites["GBR"][1], 123.0)
+        self.assertNotIn("FRA", sites)
+        # countries without a location are left out, and reported
+        self.assertNotIn("XXX", sites)
+        warn_unlocated.assert_called_once_with(("XXX",))
@@ -0,0 +1,95 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import snapshot
+from cube import aggregate_forecasts, build_forecast_cube
+
+
+def make_snapshot(version: str) -> snapshot.Snapshot:
+    forecasts = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(["2025-01-01 00:00", "2025-01-01 00:15"]),
+            "power_gw": [0.0, 1.0],
+            "power_percentage": [0.0, 50.0],
+            "country_code": ["GBR", "GBR"],
+        },
+    )
+    return snapshot.Snapshot(
+        version=version,
+        forecast_hour="2025-01-01T00:00:00",
+        created_at="2025-01-01T00:05:00+00:00",
+        forecasts=forecasts,
+        aggregates=aggregate_forecasts(build_forecast_cube(forecasts)),
+    )
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch("snapshot.snapshot_dir", Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(snapshot.load_snapshot.cache_clear)
+
+    def test_no_snapshot(self) -> None:
+        self.assertIsNone(snapshot.load_latest_snapshot())
+
+    def test_write_and_load_latest(self) -> None:
+        for i in range(5):
+            snapshot.write_snapshot(make_snapshot(f"2025010{i}T000500Z"), missing=[])
+
+        latest = snapshot.load_latest_snapshot()
+
+        if latest is None:
+            self.fail("no latest snapshot")
+        self.assertEqual(latest.version, "20250104T000500Z")
+        pd.testing.assert_frame_equal(latest.forecasts, make_snapshot("x").forecasts)
+        # old snapshots are removed, and no temporary files are left behind
+        self.assertEqual(
+            sorted(p.name for p in Path(self.tmp.name).iterdir()),
+            ["20250102T000500Z", "20250103T000500Z", "20250104T000500Z", "LATEST"],
+        )
+
+    def test_aggregates_are_written_with_snapshot(self) -> None:
+        written = make_snapshot("20250101T000500Z")
+        snapshot.write_snapshot(written, missing=[])
+
+        loaded = snapshot.load_snapshot("20250101T000500Z")
+
+        pd.testing.assert_frame_equal(loaded.aggregates.total, written.aggregates.total)
+        pd.testing.assert_frame_equal(
+            loaded.aggregates.top_countries,
+            written.aggregates.top_countries,
+        )
+        pd.testing.assert_frame_equal(loaded.aggregates.regions, written.aggregates.regions)
+        self.assertEqual(list(loaded.aggregates.total["power_gw"]), [0.0, 1.0])
+        self.assertEqual(list(loaded.aggregates.regions["Europe"]), [0.0, 1.0])
+
+    def test_seconds_until_next_run(self) -> None:
+        self.assertLessEqual(snapshot.seconds_until_next_run(), 3600)
+        self.assertGreater(snapshot.seconds_until_next_run(), 0)
+
+    def test_first_snapshot_goes_through_the_cache(self) -> None:
+        class Stop(Exception):
+            pass
+
+        def run_once() -> None:
+            with (
+                patch("snapshot.build_snapshot") as build_snapshot,
+                patch("snapshot.time.sleep", side_effect=Stop),
+                self.assertRaises(Stop),
+            ):
+                snapshot.run_scheduler()
+            self.calls.append(dict(build_snapshot.call_args.kwargs))
+
+        self.calls: list[dict[str, bool]] = []
+        run_once()
+        snapshot.write_snapshot(make_snapshot("20250101T000500Z"), missing=[])
+        run_once()
+
+        # without a snapshot the pages are fetching too, after that the snapshot is out of date
+        self.assertEqual(self.calls, [{"fresh": False}, {"fresh": True}])
@@ -0,0 +1,75 @@
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+import shapely
+from registry import load_country_registry
+from spatial import CountryIndex, load_country_index, validate_locations
+
+
+class TestCountryIndex(unittest.TestCase):
+    def test_countries_at(self) -> None:
+        # London, Paris, Sydney and the middle of the Atlantic
+        lats = np.array([51.5, 48.86, -33.87, 30.0])
+        lons = np.array([-0.12, 2.35, 151.21, -40.0])
+
+        countries = load_country_index().countries_at(lats, lons)
+
+        self.assertEqual(list(countries), ["GBR", "FRA", "AUS", None])
+
+    def test_border_goes_to_the_first_country(self) -> None:
+        # two squares sharing the edge at lon 1, in either order in the index
+        countries = {"WST": shapely.box(0, 0, 1, 1), "EST": shapely.box(1, 0, 2, 1)}
+        lats, lons = np.array([0.5, 0.5, 0.5]), np.array([0.5, 1.0, 1.5])
+        for first, second in [("WST", "EST"), ("EST", "WST")]:
+            geometries = np.array([countries[first], countries[second]])
+            index = CountryIndex(
+                country_codes=np.array([first, second], dtype=object),
+                geometries=geometries,
+                tree=shapely.STRtree(geometries),
+            )
+
+            located = index.countries_at(lats, lons)
+
+            self.assertEqual(list(located), ["WST", first, "EST"])
+
+    def test_locate_snaps_to_nearby_coast(self) -> None:
+        # just off the coast of Brighton, and far out at sea
+        lats = np.array([50.7, 30.0])
+        lons = np.array([-0.14, -40.0])
+
+        countries = load_country_index().locate(lats, lons, max_distance_degrees=0.5)
+
+        self.assertEqual(list(countries), ["GBR", None])
+
+    def test_nearest_countries(self) -> None:
+        countries, distances = load_country_index().nearest_countries(
+            np.array([51.5, 50.7]),
+            np.array([-0.12, -0.14]),
+        )
+
+        self.assertEqual(list(countries), ["GBR", "GBR"])
+        self.assertEqual(distances[0], 0)
+        self.assertGreater(distances[1], 0)
+
+    def test_many_points_are_fast(self) -> None:
+        rng = np.random.default_rng(0)
+        lats, lons = rng.uniform(-60, 70, 50_000), rng.uniform(-180, 180, 50_000)
+        index = load_country_index()
+
+        start = time.perf_counter()
+        countries = index.locate(lats, lons)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(countries), 50_000)
+        self.assertGreater(pd.notna(countries).sum(), 10_000)
+        self.assertLess(elapsed, 5)
+
+    def test_registry_locations_are_in_their_countries(self) -> None:
+        checked = validate_locations(load_country_registry())
+
+        self.assertEqual(list(checked.index[checked["valid"] == False]), [])  # noqa: E712
+        self.assertTrue(checked.loc["USA", "valid"])
+        # small states without polygons can't be checked
+        self.assertTrue(pd.isna(checked.loc["SGP", "valid"]))
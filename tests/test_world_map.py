@@ -0,0 +1,71 @@
+import json
+import unittest
+from typing import Any
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io
+import plotly.tools
+from geometry import load_world_geojson
+from world_map import (
+    get_base_map_figure,
+    get_map_country_codes,
+    make_animated_map_figure,
+    make_map_figure,
+)
+
+
+class TestWorldMap(unittest.TestCase):
+    def test_map_matches_full_figure(self) -> None:
+        country_codes = get_map_country_codes("low")
+        z = np.linspace(0, 1, len(country_codes))
+        z[0] = np.nan
+
+        fig = go.Figure(
+            data=go.Choroplethmap(
+                geojson=load_world_geojson("low"),
+                locations=country_codes,
+                z=z.tolist(),
+                colorscale="Viridis",
+                colorbar_title="Power [GW]",
+                marker_opacity=0.5,
+                hovertemplate="<b>%{customdata}</b><br>Power: %{z:.2f} GW<extra></extra>",
+                customdata=country_codes,
+            ),
+        )
+        fig.update_layout(
+            mapbox_style="carto-positron",
+            margin={"r": 0, "t": 0, "l": 0, "b": 0},
+            geo_scope="world",
+        )
+
+        # as streamlit serialises them
+        def to_json(figure: go.Figure) -> dict[str, Any]:
+            figure_dict = plotly.tools.return_figure_from_figure_or_data(figure, True)
+            figure_json: dict[str, Any] = json.loads(plotly.io.to_json(figure_dict, validate=False))
+            return figure_json
+
+        self.assertEqual(to_json(make_map_figure("low", z, "Power [GW]")), to_json(fig))
+
+    def test_base_figure_is_not_modified(self) -> None:
+        country_codes = get_map_country_codes("low")
+        make_map_figure("low", np.ones(len(country_codes)), "Power [%]")
+
+        trace = get_base_map_figure("low")["data"][0]
+        self.assertNotIn("z", trace)
+        self.assertNotIn("colorbar", trace)
+
+    def test_animated_map(self) -> None:
+        country_codes = get_map_country_codes("low")
+        frame_z = np.arange(3 * len(country_codes), dtype=float).reshape(3, -1)
+
+        fig = make_animated_map_figure("low", ["a", "b", "c"], frame_z, "Power [GW]")
+        figure_dict = fig.to_dict()
+
+        # it is a valid figure, with the geometries only in the base trace
+        go.Figure(figure_dict)
+        self.assertEqual([f["name"] for f in figure_dict["frames"]], ["a", "b", "c"])
+        for frame, z in zip(figure_dict["frames"], frame_z, strict=True):
+            self.assertEqual(set(frame["data"][0]), {"type", "z"})
+            np.testing.assert_array_equal(frame["data"][0]["z"], z)
+        self.assertEqual(figure_dict["data"][0]["zmax"], frame_z.max())